@@ -9,6 +9,7 @@ from langchain.agents import create_react_agent, AgentExecutor
 from typing import List, Tuple
 from .tools import *
 from .message import MessageManager
+from .resources import get_document_processor, get_shared
 
 
 load_dotenv()
@@ -32,17 +33,17 @@ class ATRI:
         # 初始化 agent 可使用的工具集合
         tools = [TodoManagerTool(db = TodoDatabase()),
                 GetCurrentTimeTool(),
-                KnowledgeTool(knowledge_base = DocumentProcessor()),
+                KnowledgeTool(knowledge_base = get_document_processor()),
                 NoteSaveTool(note_manager = NoteManager(sync_with_knowledge_base = sync_with_knowledge_base))
                 ]
 
-        # 初始化大语言模型,负责决策
-        self.llm = ChatOpenAIIn05(
+        # 初始化大语言模型,负责决策。同一模型的客户端在进程内共享
+        self.llm = get_shared(f"chat_llm:{model}", lambda: ChatOpenAIIn05(
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
             model=model,
             api_key= os.getenv("API_KEY"),
             temperature=0
-        )
+        ))
 
         template = '''
 你是一名名为亚托莉（ATRI）的人工智能助手，你的设计灵感来源于视觉小说《ATRI -My Dear Moments-》中的角色。以下是关于你的一些关键设定：
@@ -1,60 +1,173 @@
 import os
-import uuid
-import markdown
+import time
+import heapq
+import hashlib
+import threading
 import dashscope
+import numpy as np
 
-from pathlib import Path
+from collections import OrderedDict, Counter
 from http import HTTPStatus
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.language_models import BaseChatModel
 from langchain_community.chat_models import ChatTongyi
-from typing import Optional,Dict, List, Generator, Any,Union
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader,PyPDFLoader,Docx2txtLoader
+from typing import Optional,Dict, List, Generator, Any,Union,Tuple,Iterable
+from .cache import EmbeddingCache, SummaryCache, ResultCache, content_hash
+from .embeddings import EmbeddingBackend, LocalHashEmbeddingFunction
+from .tokenizer import get_token_counter
+from .summarizer import HierarchicalSummarizer
+from .pipeline import IngestionPipeline, list_supported_files
+from .keyword_index import BM25Index
+from .rerank import mmr_rerank, threshold_filter, reciprocal_rank_fusion
+from .vector_stores import ChromaStore, FlatVectorStore, VectorStore
+from .catalog import DocumentCatalog
+from .loaders import MarkdownLoader, ParserPool, get_loader
+from .chunker import StructuredChunker
+from .dedup import DedupStats, NearDuplicateIndex
 
 
 # 加载环境变量
 load_dotenv()
 dashscope.api_key = os.getenv("API_KEY")
 
-# markdown加载器
-class MarkdownLoader(TextLoader):
-    def __init__(self, file_path: Union[str, Path], encoding: Optional[str] = None, autodetect_encoding: bool = False):
-        """Initialize with file path and optional encoding and autodetection flag."""
-        super().__init__(file_path, encoding=encoding, autodetect_encoding=autodetect_encoding)
-
-    @staticmethod
-    def _remove_markdown(text: str) -> str:
-        """ 将Markdown文本转换为HTML，然后从中提取纯文本。 """
-        html = markdown.markdown(text)
-        soup = BeautifulSoup(html, "html.parser")
-        return soup.get_text()
-
-    def load(self) -> List[Document]:
-        """ 加载文件并将Markdown转换为纯文本。 """
-        documents = []
-        for doc in self.lazy_load():
-            text_content = self._remove_markdown(doc.page_content)
-            metadata = doc.metadata
-            documents.append(Document(page_content=text_content, metadata=metadata))
-        return documents
-
 # 嵌入api-自动批处理
-class QwenEmbeddingFunction:
+class QwenEmbeddingFunction(EmbeddingBackend):
     DASHSCOPE_MAX_BATCH_SIZE = 25  # 最多支持25条，每条最长支持2048tokens
-    
+    DASHSCOPE_MAX_TEXT_TOKENS = 2048
+    # 单次请求的token总数。接口只限制条数和单条长度（合计上限 25×2048），长文本装满25条的请求
+    # 耗时长、失败重试的代价大；按token预算装箱后，长文本分散到多个请求并发发送，短文本仍可装满25条
+    DEFAULT_BATCH_TOKENS = 8192
+
+    def __init__(self, max_workers: int = int(os.getenv("embedding_max_workers", 4)), max_retries: int = 3, retry_backoff: float = 0.5,
+                 cache_path: Optional[str] = os.getenv("embedding_cache_path", "./user_data/embedding_cache.db"),
+                 cache_max_size_mb: float = float(os.getenv("embedding_cache_max_mb", 512)),
+                 query_cache_size: int = 256,
+                 max_text_tokens: int = 1800,
+                 max_batch_tokens: int = int(os.getenv("embedding_max_batch_tokens", DEFAULT_BATCH_TOKENS))):
+        """
+        :param max_workers: 同时在途的嵌入请求数，为1时退化为串行请求
+        :param max_retries: 单个批次失败后的最大重试次数
+        :param retry_backoff: 重试的初始等待秒数，每次重试翻倍
+        :param cache_path: 嵌入缓存数据库路径，为 None 时不使用缓存
+        :param cache_max_size_mb: 嵌入缓存的最大占用空间
+        :param query_cache_size: 内存中缓存的查询向量个数，为0时不缓存
+        :param max_text_tokens: 单条文本的token上限，超出的文本切段嵌入后再合并。
+                                tiktoken 与 DashScope 分词结果不完全一致，默认值在2048之下留有余量
+        :param max_batch_tokens: 单次请求的token总数上限，不超过接口的合计上限 25×2048
+        """
+        self.model = dashscope.TextEmbedding.Models.text_embedding_v2
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.cache = EmbeddingCache(cache_path, max_size_mb=cache_max_size_mb) if cache_path else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self.max_text_tokens = min(max_text_tokens, self.DASHSCOPE_MAX_TEXT_TOKENS)
+        self.max_batch_tokens = min(max_batch_tokens, self.DASHSCOPE_MAX_BATCH_SIZE * self.DASHSCOPE_MAX_TEXT_TOKENS)
+        self.token_counter = get_token_counter()
+
+    @property
+    def hit_rate(self) -> float:
+        """缓存命中率，尚未查询过时为0。"""
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
     def __call__(self, input: List[str], text_type: str = "document") -> List[List[float]]:
-        embeddings = []
-        for batch in self.batched(input, batch_size=self.DASHSCOPE_MAX_BATCH_SIZE):
-            resp = self.embed_with_list_of_str(batch, text_type)
-            if resp and resp.status_code == HTTPStatus.OK:
-                embeddings.extend([emb['embedding'] for emb in resp.output['embeddings']])
-            else:
-                print(f"Error in embedding: {resp}")
+        if self.cache is None:
+            return self._embed_texts(input, text_type)
+
+        embeddings = self.cache.get_many(self.model, text_type, input)
+        # 只对未命中的文本调用api，同一次调用中重复的文本只请求一次
+        missing_texts = list(dict.fromkeys(text for text, emb in zip(input, embeddings) if emb is None))
+        miss_count = sum(emb is None for emb in embeddings)
+        self.cache_hits += len(input) - miss_count
+        self.cache_misses += miss_count
+        if missing_texts:
+            missing_embeddings = self._embed_texts(missing_texts, text_type)
+            self.cache.put_many(self.model, text_type, missing_texts, missing_embeddings)
+            computed = dict(zip(missing_texts, missing_embeddings))
+            embeddings = [emb if emb is not None else computed[text] for text, emb in zip(input, embeddings)]
         return embeddings
+
+    def _embed_texts(self, input: List[str], text_type: str) -> List[List[float]]:
+        """ 按批次并发调用嵌入api，不经过缓存。超长文本先切段，嵌入后按token数加权合并。 """
+        pieces, owners, token_counts = [], [], []
+        for i, text in enumerate(input):
+            for piece, tokens in self.token_counter.split_with_counts(text, self.max_text_tokens):
+                pieces.append(piece)
+                owners.append(i)
+                token_counts.append(tokens)
+
+        batches = [pieces[start:end] for start, end in self.pack_batches(token_counts, self.DASHSCOPE_MAX_BATCH_SIZE, self.max_batch_tokens)]
+        if self.max_workers == 1 or len(batches) <= 1:
+            results = [self._embed_batch(batch, text_type) for batch in batches]
+        else:
+            # 多个批次并发请求，executor.map 保证结果顺序与输入一致
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(lambda batch: self._embed_batch(batch, text_type), batches))
+
+        embeddings = []
+        for batch_embeddings in results:
+            embeddings.extend(batch_embeddings)
+        if len(pieces) == len(input):
+            return embeddings
+
+        # 合并同一文本的多段向量，并重新归一化
+        combined = np.zeros((len(input), len(embeddings[0])), dtype=np.float32)
+        np.add.at(combined, owners, np.asarray(embeddings, dtype=np.float32) * np.asarray(token_counts, dtype=np.float32)[:, None])
+        combined /= np.maximum(np.linalg.norm(combined, axis=1, keepdims=True), 1e-12)
+        return combined.tolist()
+
+    def _embed_batch(self, batch: List[str], text_type: str) -> List[List[float]]:
+        """
+        嵌入单个批次，失败时按指数退避重试。
+        
+        :param batch: 不超过 DASHSCOPE_MAX_BATCH_SIZE 条的文本
+        :param text_type: 文本类型，'document' 或 'query'
+        :return: 与 batch 顺序一致的向量列表
+        :raises RuntimeError: 重试次数用尽后仍然失败
+        """
+        resp = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self.embed_with_list_of_str(batch, text_type)
+            except Exception as e:
+                resp = e
+            if resp is not None and not isinstance(resp, Exception) and resp.status_code == HTTPStatus.OK:
+                embeddings = sorted(resp.output['embeddings'], key=lambda emb: emb['text_index'])
+                return [emb['embedding'] for emb in embeddings]
+            if attempt < self.max_retries:
+                print(f"Error in embedding: {resp}, 第{attempt + 1}次重试")
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        # 抛出异常而不是静默丢弃，避免向量与文本数量对不上
+        raise RuntimeError(f"Error in embedding: {resp}")
     
+    @staticmethod
+    def pack_batches(token_counts: List[int], max_batch_size: int = DASHSCOPE_MAX_BATCH_SIZE,
+                     max_batch_tokens: int = DEFAULT_BATCH_TOKENS) -> Generator[Tuple[int, int], None, None]:
+        """
+        按顺序把文本装入请求，每个请求同时满足条数上限和token总数上限。
+
+        :param token_counts: 每条文本的token数
+        :param max_batch_size: 单次请求的最大条数
+        :param max_batch_tokens: 单次请求的最大token总数
+        :return: 每个请求对应的 (起始下标, 结束下标)
+        """
+        start, batch_tokens = 0, 0
+        for i, tokens in enumerate(token_counts):
+            if i > start and (i - start >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+                yield start, i
+                start, batch_tokens = i, 0
+            batch_tokens += tokens
+        if start < len(token_counts):
+            yield start, len(token_counts)
+
     @staticmethod
     def batched(inputs: List[Any], batch_size: int = DASHSCOPE_MAX_BATCH_SIZE) -> Generator[List[Any], None, None]:
         for i in range(0, len(inputs), batch_size):
@@ -64,7 +177,7 @@ class QwenEmbeddingFunction:
         result = None
         for batch in self.batched(inputs, batch_size=self.DASHSCOPE_MAX_BATCH_SIZE):
             resp = dashscope.TextEmbedding.call(
-                model=dashscope.TextEmbedding.Models.text_embedding_v2,
+                model=self.model,
                 input=batch,
                 text_type=text_type  # 指定文本类型
             )
@@ -80,37 +193,127 @@ class QwenEmbeddingFunction:
                 print(f"Error in embedding batch: {resp}")
         return result
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self(texts, text_type="document")
+    def embed_query(self, text: str) -> List[float]:
+        """ 嵌入查询文本，最近使用过的查询直接从内存LRU中返回。 """
+        with self._query_cache_lock:
+            if text in self._query_cache:
+                self._query_cache.move_to_end(text)
+                return self._query_cache[text]
+
+        embedding = self([text], text_type="query")[0]
+        if self.query_cache_size > 0:
+            with self._query_cache_lock:
+                self._query_cache[text] = embedding
+                self._query_cache.move_to_end(text)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return embedding
+
+# 可选的嵌入后端，通过环境变量 embedding_backend 或构造参数选择
+EMBEDDING_BACKENDS = {
+    'qwen': QwenEmbeddingFunction,
+    'local': LocalHashEmbeddingFunction,
+}
 
-    def embed_query(self, texts: List[str]) -> List[List[float]]:
-        return self(texts, text_type="query")[0]
+# 可选的向量库后端，通过环境变量 vector_store_backend 或构造参数选择
+VECTOR_STORE_BACKENDS = {
+    'chroma': ChromaStore,
+    'flat': FlatVectorStore,
+}
 
 # 知识库管理
 class DocumentProcessor:
-    def __init__(self, persist_directory: str = os.getenv("vector_db_path")):
+    RETRIEVAL_STRATEGIES = ('summary', 'direct', 'both')
+    DELETE_BATCH_SIZE = 5000  # 单次删除的最大id数
+    PAGE_METADATA_KEYS = ('page', 'title', 'tags')  # 随切分保存的页面元数据：PDF 页码，Markdown 头信息中的标题和标签
+
+    def __init__(self, persist_directory: str = os.getenv("vector_db_path"),
+                 embedding_backend: Union[str, EmbeddingBackend] = os.getenv("embedding_backend", "qwen"),
+                 llm: Optional[BaseChatModel] = None,
+                 vector_store_backend: str = os.getenv("vector_store_backend", "chroma")):
+        """
+        :param persist_directory: 向量库目录
+        :param embedding_backend: 嵌入后端名称（见 EMBEDDING_BACKENDS）或已创建的后端实例。
+                                  不同后端的向量维度不同，切换后端时请同时更换向量库目录
+        :param llm: 生成摘要的模型，默认使用 qwen2.5-3b-instruct
+        :param vector_store_backend: 向量库后端（见 VECTOR_STORE_BACKENDS）。'chroma' 使用 Chroma，
+                                     'flat' 使用内存映射的精确检索，适合几万个切分以内的知识库。两种后端的数据不互通
+        """
         self.persist_directory = persist_directory
-        self.llm = ChatTongyi(model="qwen2.5-3b-instruct", api_key=os.getenv("API_KEY"))
-        self.embedding_function = QwenEmbeddingFunction()
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=0)
+        self.llm = llm or ChatTongyi(model="qwen2.5-3b-instruct", api_key=os.getenv("API_KEY"))
+        if isinstance(embedding_backend, str):
+            if embedding_backend not in EMBEDDING_BACKENDS:
+                raise ValueError(f"无效的 embedding_backend: {embedding_backend}. 合法的值有: {', '.join(EMBEDDING_BACKENDS)}")
+            embedding_backend = EMBEDDING_BACKENDS[embedding_backend]()
+        self.embedding_function = embedding_backend
+        self.chunker = StructuredChunker()  # 按标题、段落、句子切分，大小按token计量
+        self.ingest_batch_size = 100  # 流式写入时每批写入向量库的切分数
+        if self.persist_directory:
+            os.makedirs(self.persist_directory, exist_ok=True)
+        # 摘要缓存与向量库放在同一目录，不同知识库（包括临时创建的）互不共用；没有目录时不缓存
+        summary_cache_path = os.getenv("summary_cache_path", os.path.join(self.persist_directory, "summary_cache.db") if self.persist_directory else "")
+        self.summarizer = HierarchicalSummarizer(self.llm, cache=SummaryCache(summary_cache_path) if summary_cache_path else None)
+        self.parser_pool = ParserPool()  # 多个文档入库时在解析进程中解析
         
         # 初始化三个集合
-        self.summary_client = Chroma(
+        if vector_store_backend not in VECTOR_STORE_BACKENDS:
+            raise ValueError(f"无效的 vector_store_backend: {vector_store_backend}. 合法的值有: {', '.join(VECTOR_STORE_BACKENDS)}")
+        store_class = VECTOR_STORE_BACKENDS[vector_store_backend]
+        self.summary_client = store_class(
             collection_name="summaries",
             persist_directory=self.persist_directory,
             embedding_function=self.embedding_function
         )
-        self.document_client = Chroma(
+        self.document_client = store_class(
             collection_name="documents",
             persist_directory=self.persist_directory,
             embedding_function=self.embedding_function
         )
-        self.note_client = Chroma(
+        self.note_client = store_class(
             collection_name="notes",
             persist_directory=self.persist_directory,
             embedding_function=self.embedding_function
         )
 
+        # 已入库文档的目录，文档列表和存在性检查直接读目录，不扫描向量库
+        self.catalog = DocumentCatalog(os.path.join(self.persist_directory, "catalog.db") if self.persist_directory else ":memory:")
+        self._sync_catalog()
+
+        # 检索结果缓存，知识库每次写入都会增加版本号，使已缓存的结果失效。
+        # 只能感知本实例的写入，多个实例共用一个向量库时请共用同一个 DocumentProcessor
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self.retrieval_strategy = os.getenv("retrieval_strategy", "summary")
+        self.last_query_timings: Dict[str, Any] = {}  # 最近一次 query 各阶段的耗时（秒）
+        self.result_cache = ResultCache(max_size=int(os.getenv("query_cache_size", 256)), ttl=float(os.getenv("query_cache_ttl", 600)))
+
+        # 切分的BM25关键字索引，首次使用时加载，入库和删除时同步更新
+        self._keyword_index: Optional[BM25Index] = None
+        self._keyword_index_lock = threading.Lock()
+        self._keyword_index_path = os.path.join(self.persist_directory, "keyword_index.db") if self.persist_directory else None
+
+        # 近似重复切分的 MinHash 索引，首次使用时加载，入库和删除时同步更新。
+        # 与已有切分近似重复的切分复用已有切分的向量，不再调用嵌入。默认关闭（阈值为0），
+        # 开启时建议不低于0.95，阈值低时只有名称、数字、日期不同的模板段落也会共用一个向量，见 NearDuplicateIndex
+        self.dedup_threshold = float(os.getenv("dedup_threshold", 0))
+        self.dedup_stats = DedupStats()  # 最近一次入库的去重统计
+        self._dedup_index: Optional[NearDuplicateIndex] = None
+        self._dedup_lock = threading.Lock()
+
+    def close(self) -> None:
+        """ 关闭向量库、索引和缓存的数据库连接，停止解析进程。关闭后实例不再可用。 """
+        self.parser_pool.shutdown()
+        for client in (self.summary_client, self.document_client, self.note_client):
+            if hasattr(client, 'close'):
+                client.close()
+        self.catalog.close()
+        if self._keyword_index is not None:
+            self._keyword_index.close()
+        if self._dedup_index is not None:
+            self._dedup_index.close()
+        if self.summarizer.cache is not None:
+            self.summarizer.cache.close()
+
     def validate_doc_type(self, doc_type: str) -> None:
         """
         验证 doc_type 是否合法。
@@ -125,77 +328,497 @@ class DocumentProcessor:
     # 生成摘要
     def generate_summary(self, text: str) -> str:
         """
-        使用提示词生成文本的摘要。
+        使用提示词生成文本的摘要。长文本会分段并行摘要后逐层合并。
         
         :param text: 需要生成摘要的文本
         :return: 生成的摘要
         """
-        prompt = f"请为以下文本生成一个简明扼要的摘要，概括主要观点和关键信息。摘要长度通常150字左右，可以根据实际情况调整：\n{text}"
-        response = self.llm.invoke(prompt).content
-        return response
+        summary = self.summarizer.summarize([text])
+        self._report_summary_timings(self.summarizer.last_timings)
+        return summary
+
+    @staticmethod
+    def _report_summary_timings(timings: Dict[str, float]) -> None:
+        print(f"摘要耗时: 分段摘要 {timings['map']:.2f}s（{timings['segments']}段）, "
+              f"合并 {timings['reduce']:.2f}s（{timings['levels']}层）, 共 {timings['total']:.2f}s, "
+              f"模型调用 {timings['llm_calls']}次, 缓存命中 {timings['cache_hits']}次")
 
     # 获取文档列表
     def get_document_list(self, doc_type: str) -> List[str]:
         """
-        获取所有文档的源路径列表。
+        获取所有文档的源路径列表，按入库时间排序。
         
         :param doc_type: 文档类型，'note' 或 'document' 或 'all'
         :return: 文档源路径列表
         """
         self.validate_doc_type(doc_type)
+        return [entry['source'] for entry in self.catalog.list(doc_type)]
+
+    def get_document_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取知识库统计信息。
         
-        if doc_type == "all":
-            results = self.summary_client.get(include=["metadatas"])
-        else:
-            results = self.summary_client.get(include=["metadatas"], where={'type': doc_type})
-        document_list = [metadata['source'] for metadata in results.get("metadatas", [])]
-        return document_list
+        :return: {文档类型: {'documents': 文档数, 'chunks': 切分数}}
+        """
+        return self.catalog.stats()
+
+    def _sync_catalog(self) -> None:
+        """ 文档目录与向量库中的摘要数量不一致时（如旧版本创建的向量库），从向量库重建目录。 """
+        if len(self.catalog) == self.summary_client.count():
+            return
+        summaries = self.summary_client.get(include=["metadatas"])
+        chunk_counts = Counter()
+        for doc_type, client in (('document', self.document_client), ('note', self.note_client)):
+            for metadata in client.get(include=["metadatas"])['metadatas']:
+                chunk_counts[(metadata['source'], doc_type)] += 1
+        rows = [{'source': metadata['source'], 'type': metadata['type'], 'content_hash': None,
+                 'chunk_count': chunk_counts[(metadata['source'], metadata['type'])], 'summary_id': summary_id,
+                 'mtime': os.path.getmtime(metadata['source']) if os.path.exists(metadata['source']) else None}
+                for summary_id, metadata in zip(summaries['ids'], summaries['metadatas'])]
+        self.catalog.clear()
+        self.catalog.put_many(rows)
+        print(f"已从向量库重建文档目录: {len(rows)}个文档")
+
+    def _record_document(self, document_path: str, doc_type: str, document_hash: Optional[str], chunk_count: int) -> None:
+        """ 文档入库完成后写入文档目录。 """
+        mtime = os.path.getmtime(document_path) if os.path.exists(document_path) else None
+        self.catalog.put(document_path, doc_type, document_hash, chunk_count, self.summary_id(document_path, doc_type), mtime)
     
+    # 根据文件类型选择合适的加载器
+    @staticmethod
+    def get_loader(document_path: str) -> BaseLoader:
+        """
+        根据文件扩展名创建加载器。
+        
+        :param document_path: 文档路径
+        :return: 对应的 langchain 加载器
+        :raises ValueError: 不支持的文档类型
+        """
+        return get_loader(document_path)
+
+    def iter_chunks(self, pages: Iterable[Document], document_path: str, doc_type: str) -> Generator[Tuple[str, str, dict], None, None]:
+        """
+        逐页切分文本，生成 (切分id, 切分文本, 元数据)。切分不会跨页，PDF 的页码记录在元数据的 page 字段中。
+        切分id由文档路径和切分内容决定，内容不变的切分在重新索引时id也不变。
+        元数据还记录切分在文档中的序号 chunk_index（跨页连续编号）、在页内的字符位置 start_char/end_char
+        和所在节的标题路径 heading_path（如 '安装 > 环境配置'，没有标题时为空字符串），get_neighbors 按序号取相邻切分。
+        Markdown 头信息中的标题和标签记录在 title、tags 字段中。
+        
+        :param pages: 加载器逐页产出的文档
+        :param document_path: 文档路径
+        :param doc_type: 文档类型，'note' 或 'document'
+        """
+        occurrences: Dict[str, int] = {}
+        chunk_index = 0
+        for page in pages:
+            for chunk in self.chunker.split(page.page_content):
+                text_hash = content_hash(chunk.text)
+                # 同一文档中内容相同的切分按出现次数区分
+                occurrence = occurrences.get(text_hash, 0)
+                occurrences[text_hash] = occurrence + 1
+                metadata = {'source': document_path, 'type': doc_type, 'content_hash': text_hash, 'chunk_index': chunk_index,
+                            'start_char': chunk.start, 'end_char': chunk.end, 'heading_path': ' > '.join(chunk.heading_path)}
+                metadata.update((key, page.metadata[key]) for key in self.PAGE_METADATA_KEYS if key in page.metadata)
+                chunk_index += 1
+                yield self.chunk_id(document_path, text_hash, occurrence), chunk.text, metadata
+
+    @classmethod
+    def page_hash_text(cls, page: Document) -> str:
+        """ 页面参与文档内容哈希的文本。头信息中的标题和标签也计入，只修改标签时重新索引同样会更新切分的元数据。 """
+        return page.page_content + "".join(f"\0{key}={page.metadata[key]}" for key in cls.PAGE_METADATA_KEYS[1:] if key in page.metadata)
+
+    @staticmethod
+    def chunk_id(document_path: str, text_hash: str, occurrence: int = 0) -> str:
+        """ 由文档路径、切分内容哈希和出现次序生成稳定的切分id。 """
+        return content_hash(f"{document_path}\0{text_hash}\0{occurrence}")
+
+    @staticmethod
+    def summary_id(document_path: str, doc_type: str) -> str:
+        """ 每个文档只有一条摘要，id由路径和类型决定。 """
+        return content_hash(f"summary\0{doc_type}\0{document_path}")
+
     # 插入文档列表
     def load_and_embed_documents(self, document_paths: List[str], doc_type: str) -> None:
+        """
+        流式加载并嵌入文档：逐页读取、切分，按批嵌入写入，内存占用与文档页数无关。
+        一次添加多个文档时，文档在解析进程中并行解析并按顺序逐个入库，此时每个文档会完整解析后再入库。
         
+        :param document_paths: 文档路径列表
+        :param doc_type: 文档类型，'note' 或 'document'
+        """
         self.validate_doc_type(doc_type)
-        
+        self.dedup_stats = DedupStats()
+        existing = self.catalog.get_many(document_paths, doc_type)
+        new_paths = []
         for document_path in document_paths:
-            try:
-                # 检查是否已存在相同文档名的文档
-                if self.document_exists(document_path, doc_type):
-                    print(f"文档已存在于{doc_type}: {document_path}")
-                    continue
-                
-                # 根据文件类型选择合适的加载器
-                if document_path.endswith('.md'):
-                    loader = MarkdownLoader(document_path, autodetect_encoding=True)
-                elif document_path.endswith('.txt'):
-                    loader = TextLoader(document_path, autodetect_encoding=True)
-                elif document_path.endswith('.pdf'):
-                    loader = PyPDFLoader(document_path)
-                elif document_path.endswith('.docx'):
-                    loader = Docx2txtLoader(document_path)
-                else:
-                    raise ValueError("未知类型文档. 当前仅支持 .md, .txt, .pdf 和 .docx 格式的文档")
+            # 检查是否已存在相同文档名的文档
+            if document_path in existing:
+                print(f"文档已存在于{doc_type}: {document_path}")
+                continue
+            new_paths.append(document_path)
 
-                documents = loader.load()
-                text = documents[0].page_content
+        # 多个文档时，当前文档入库的同时后面的文档已在解析进程（进程数为1时为后台线程）中解析；单个文档仍在本线程逐页读取
+        if len(new_paths) > 1:
+            parsed = self.parser_pool.imap(new_paths)
+        else:
+            parsed = ((document_path, None, None) for document_path in new_paths)
+
+        for document_path, parsed_pages, parse_error in parsed:
+            client = self.note_client if doc_type == 'note' else self.document_client
+            added_ids = []
+            summary_job = None
+            try:
+                if parse_error is not None:
+                    raise parse_error
+                source_pages = parsed_pages if parsed_pages is not None else self.get_loader(document_path).lazy_load()
 
-                # 生成摘要
-                summary = self.generate_summary(text)
-                
-                # 存储摘要
-                self.summary_client.add_texts(texts=[summary], metadatas=[{'source': document_path, 'type': doc_type}], ids=[str(uuid.uuid4())])
+                # 边读取边把正文交给分层摘要，摘要与切分嵌入同时进行，同时计算全文哈希
+                summary_job = self.summarizer.start()
+                hasher = hashlib.sha256()
+                def pages():
+                    for page in source_pages:
+                        summary_job.feed(page.page_content)
+                        hasher.update(self.page_hash_text(page).encode('utf-8'))
+                        yield page
 
-                # 分割文本
-                split_texts = self.text_splitter.split_text(text)
-                document_ids = [str(uuid.uuid4()) for _ in range(len(split_texts))]
-                metadatas = [{'source': document_path, 'type': doc_type}] * len(split_texts)
+                # 分割文本并分批存储，每批写入后即释放
+                batch_ids, batch_texts, batch_metadatas = [], [], []
+                for chunk_id, text, metadata in self.iter_chunks(pages(), document_path, doc_type):
+                    batch_ids.append(chunk_id)
+                    batch_texts.append(text)
+                    batch_metadatas.append(metadata)
+                    if len(batch_texts) >= self.ingest_batch_size:
+                        self._add_chunks(client, batch_ids, batch_texts, batch_metadatas)
+                        added_ids.extend(batch_ids)
+                        batch_ids, batch_texts, batch_metadatas = [], [], []
+                if batch_texts:
+                    self._add_chunks(client, batch_ids, batch_texts, batch_metadatas)
+                    added_ids.extend(batch_ids)
 
-                # 存储文档切分
-                client = self.note_client if doc_type == 'note' else self.document_client
-                client.add_texts(texts=split_texts, metadatas=metadatas, ids=document_ids)
-                print(f"成功处理文档: {document_path}")
+                # 生成并存储摘要，摘要写入成功才视为文档已入库
+                summary = summary_job.result()
+                self._report_summary_timings(summary_job.timings)
+                self._add_summary(document_path, doc_type, summary)
+                self._record_document(document_path, doc_type, hasher.hexdigest(), len(added_ids))
+                print(f"成功处理文档: {document_path}, 共{len(added_ids)}个切分")
 
             except Exception as e:
                 print(f"处理文档时出错: {document_path}, 错误: {e}")
+                if summary_job is not None:
+                    summary_job.cancel()
+                # 清理已写入的部分切分，避免残留不完整的文档
+                if added_ids:
+                    self._delete_chunks(client, added_ids)
+
+        self.save_keyword_index()
+        self.report_dedup_stats()
+        if self.embedding_function.cache is not None:
+            print(f"嵌入缓存命中率: {self.embedding_function.hit_rate:.1%}")
+
+    # 增量重新索引
+    def reindex_document(self, document_path: str, doc_type: str, summary_change_threshold: float = 0.3) -> Dict[str, int]:
+        """
+        按切分内容差异重新索引文档：只嵌入新增或修改的切分，删除已不存在的切分，
+        变化的切分占比超过阈值时才重新生成摘要。文档尚未入库时等同于 load_and_embed_documents。
+        先写入新切分、生成并嵌入新摘要，全部成功后才删除旧切分、替换摘要和更新文档目录；
+        中途出错时删除已写入的新切分，知识库保持重新索引之前的状态，错误只打印不抛出。
+        
+        :param document_path: 文档路径
+        :param doc_type: 文档类型，'note' 或 'document'
+        :param summary_change_threshold: 重新生成摘要所需的最小变化比例
+        :return: 新增、删除、保留的切分数，以及是否重新生成了摘要；出错时新增、删除均为0
+        """
+        self.validate_doc_type(doc_type)
+        self.dedup_stats = DedupStats()
+        client = self.note_client if doc_type == 'note' else self.document_client
+        entry = self.catalog.get_many([document_path], doc_type).get(document_path)
+        if entry is None:
+            self.load_and_embed_documents([document_path], doc_type)
+            entry = self.catalog.get_many([document_path], doc_type).get(document_path)
+            return {'added': entry[0]['chunk_count'] if entry else 0, 'deleted': 0, 'kept': 0, 'summary_regenerated': int(entry is not None)}
+
+        written_ids = []
+        try:
+            pages = list(self.get_loader(document_path).lazy_load())
+            document_hash = content_hash("".join(self.page_hash_text(page) for page in pages))
+            if document_hash == entry[0]['content_hash']:
+                print(f"文档内容未变化: {document_path}")
+                return {'added': 0, 'deleted': 0, 'kept': entry[0]['chunk_count'], 'summary_regenerated': 0}
+
+            chunks = {chunk_id: (text, metadata) for chunk_id, text, metadata in self.iter_chunks(pages, document_path, doc_type)}
+            existing = client.get(where={'source': document_path}, include=["metadatas"])
+            existing_ids = set(existing['ids'])
+            added_ids = [chunk_id for chunk_id in chunks if chunk_id not in existing_ids]
+            deleted_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in chunks]
+
+            # 第一步：写入新切分，生成并嵌入新摘要。这一步会调用嵌入接口和摘要模型，可能失败
+            for start in range(0, len(added_ids), self.ingest_batch_size):
+                batch_ids = added_ids[start:start + self.ingest_batch_size]
+                # 旧切分要等新切分写入后才删除，判重时排除它们，不复用即将删除的切分的向量
+                self._add_chunks(client, batch_ids, [chunks[i][0] for i in batch_ids], [chunks[i][1] for i in batch_ids], exclude=deleted_ids)
+                written_ids.extend(batch_ids)
+            changed_ratio = (len(added_ids) + len(deleted_ids)) / max(len(existing_ids), len(chunks), 1)
+            regenerate = changed_ratio > summary_change_threshold
+            if regenerate:
+                summary = self.generate_summary("\n".join(page.page_content for page in pages))
+                summary_embedding = self.embedding_function.embed_documents([summary])[0]
+        except Exception as e:
+            print(f"重新索引文档时出错: {document_path}, 错误: {e}")
+            # 删除已写入的新切分，旧切分和文档目录都还没有改动
+            if written_ids:
+                self._delete_chunks(client, written_ids)
+            return {'added': 0, 'deleted': 0, 'kept': entry[0]['chunk_count'], 'summary_regenerated': 0}
+
+        # 第二步：只涉及本地写入。删除旧切分，更新保留切分的元数据，替换摘要，最后更新文档目录；
+        # 这一步出错时文档目录中仍是旧的内容哈希，下次重新索引会补齐缺少的切分
+        try:
+            if deleted_ids:
+                self._delete_chunks(client, deleted_ids)
+            # 保留的切分内容不变，但序号、字符位置和标题路径可能随前后内容的增删而变化；入库时记录的 duplicate_of 保持不变
+            for chunk_id, metadata in zip(existing['ids'], existing['metadatas']):
+                if chunk_id in chunks and 'duplicate_of' in metadata:
+                    chunks[chunk_id][1]['duplicate_of'] = metadata['duplicate_of']
+            moved_ids = [chunk_id for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+                         if chunk_id in chunks and metadata != chunks[chunk_id][1]]
+            if moved_ids:
+                self._update_chunk_metadatas(client, moved_ids, [chunks[chunk_id][1] for chunk_id in moved_ids])
+            if regenerate:
+                self._delete_chunks(self.summary_client, [entry[0]['summary_id']])
+                self._add_summary(document_path, doc_type, summary, summary_embedding)
+            self._record_document(document_path, doc_type, document_hash, len(chunks))
+        except Exception as e:
+            print(f"重新索引文档时出错: {document_path}, 错误: {e}")
+            return {'added': 0, 'deleted': 0, 'kept': entry[0]['chunk_count'], 'summary_regenerated': 0}
+
+        self.save_keyword_index()
+        self.report_dedup_stats()
+        print(f"重新索引文档: {document_path}, 新增{len(added_ids)}个切分, 删除{len(deleted_ids)}个, "
+              f"保留{len(chunks) - len(added_ids)}个, {'已' if regenerate else '未'}重新生成摘要")
+        return {'added': len(added_ids), 'deleted': len(deleted_ids), 'kept': len(chunks) - len(added_ids), 'summary_regenerated': int(regenerate)}
+
+    # 多文档流水线入库
+    def ingest_directory(self, directory: str, doc_type: str, workers: Optional[Dict[str, int]] = None, queue_size: int = 8) -> Dict:
+        """
+        用流水线并发入库目录下所有支持的文档。
+        
+        :param directory: 目录路径，会递归查找 .md, .txt, .pdf 和 .docx 文件
+        :param doc_type: 文档类型，'note' 或 'document'
+        :param workers: 各阶段线程数，见 IngestionPipeline
+        :param queue_size: 阶段间队列容量
+        :return: 吞吐量报告
+        """
+        report = IngestionPipeline(self, workers=workers, queue_size=queue_size).run(list_supported_files(directory), doc_type)
+        self.save_keyword_index()
+        return report
+
+    def store_document(self, document_path: str, doc_type: str, ids: List[str], texts: List[str], metadatas: List[dict], summary: str,
+                       chunk_embeddings: Optional[List[List[float]]] = None, summary_embedding: Optional[List[float]] = None,
+                       document_hash: Optional[str] = None) -> None:
+        """
+        写入一个文档的全部切分及摘要，写入失败时清理已写入的切分。
+        
+        :param document_path: 文档路径
+        :param doc_type: 文档类型，'note' 或 'document'
+        :param ids: 切分id
+        :param texts: 切分文本
+        :param metadatas: 切分元数据
+        :param summary: 摘要
+        :param chunk_embeddings: 预先计算好的切分向量，为 None 时写入时嵌入
+        :param summary_embedding: 预先计算好的摘要向量，为 None 时写入时嵌入
+        :param document_hash: 文档全文的哈希，记录在文档目录中
+        """
+        client = self.note_client if doc_type == 'note' else self.document_client
+        added_ids = []
+        try:
+            for start in range(0, len(texts), self.ingest_batch_size):
+                end = start + self.ingest_batch_size
+                self._add_chunks(client, ids[start:end], texts[start:end], metadatas[start:end],
+                                 chunk_embeddings[start:end] if chunk_embeddings is not None else None)
+                added_ids.extend(ids[start:end])
+            self._add_summary(document_path, doc_type, summary, summary_embedding)
+            self._record_document(document_path, doc_type, document_hash, len(ids))
+        except Exception:
+            if added_ids:
+                self._delete_chunks(client, added_ids)
+            raise
+
+    def _add_chunks(self, client: VectorStore, ids: List[str], texts: List[str], metadatas: List[dict],
+                    embeddings: Optional[List[List[float]]] = None, exclude: Iterable[str] = ()) -> None:
+        """
+        写入一批切分并同步关键字索引和近似重复索引。传入 embeddings 时直接写入向量，不再调用嵌入；
+        未传入时由 embed_chunks 嵌入，近似重复的切分复用已有的向量，exclude 中即将删除的切分不会被复用。
+        """
+        dedup = self.dedup_threshold > 0 and client is not self.summary_client
+        signatures = None
+        if embeddings is None and dedup:
+            embeddings, signatures = self._embed_chunks(client, ids, texts, metadatas, exclude=exclude)
+        if embeddings is None:
+            client.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+        else:
+            client.add_embeddings(ids, embeddings, texts, metadatas)
+        self._bump_version()
+        if client is not self.summary_client:
+            self.get_keyword_index().add(ids, texts, metadatas)
+        if dedup:
+            index = self.get_dedup_index()
+            index.add(self._dedup_collection(client), ids, signatures if signatures is not None else index.signatures(texts))
+
+    def _delete_chunks(self, client: VectorStore, ids: List[str]) -> None:
+        """ 删除切分（或摘要）并同步关键字索引和近似重复索引，id很多时分批删除。 """
+        for start in range(0, len(ids), self.DELETE_BATCH_SIZE):
+            client.delete(ids=ids[start:start + self.DELETE_BATCH_SIZE])
+        self._bump_version()
+        if client is not self.summary_client:
+            self.get_keyword_index().remove(ids)
+            if self.dedup_threshold > 0:
+                self.get_dedup_index().remove(self._dedup_collection(client), ids)
+
+    def embed_chunks(self, client: VectorStore, ids: List[str], texts: List[str], metadatas: List[dict], extra_texts: List[str] = ()) -> List[List[float]]:
+        """
+        嵌入一批切分。与已有切分（或同批中靠前的切分）近似重复的切分直接复用其向量，不调用嵌入，
+        并在元数据中记录 duplicate_of（被复用向量的切分id，该切分之后可能被删除）。统计计入 dedup_stats。
+
+        :param client: 切分将写入的向量库，只与同一向量库中的切分判重
+        :param ids: 切分id
+        :param texts: 切分文本
+        :param metadatas: 切分元数据，重复的切分会增加 duplicate_of
+        :param extra_texts: 同一次调用中一并嵌入的其他文本（如摘要），不参与判重
+        :return: texts 与 extra_texts 的向量
+        """
+        if self.dedup_threshold <= 0:
+            return self.embedding_function.embed_documents(list(texts) + list(extra_texts))
+        return self._embed_chunks(client, ids, texts, metadatas, extra_texts)[0]
+
+    def _embed_chunks(self, client: VectorStore, ids: List[str], texts: List[str], metadatas: List[dict],
+                      extra_texts: List[str] = (), exclude: Iterable[str] = ()) -> Tuple[List[List[float]], List[Optional[np.ndarray]]]:
+        """ embed_chunks 的实现，同时返回切分的 MinHash 签名，写入时不必重新计算。exclude 中的已有切分不参与判重。 """
+        index = self.get_dedup_index()
+        signatures = index.signatures(texts)
+        originals = index.find(self._dedup_collection(client), ids, signatures, exclude)
+        position = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        stored_ids = list({original for i, original in enumerate(originals) if original is not None and position.get(original, i) >= i})
+        stored = {}
+        if stored_ids:
+            result = client.get(ids=stored_ids, include=["embeddings"])
+            stored = {chunk_id: np.asarray(embedding, dtype=np.float32).tolist() for chunk_id, embedding in zip(result['ids'], result['embeddings'])}
+        # 被引用的切分已从向量库中删除时仍然嵌入
+        duplicate = [original is not None and (position.get(original, i) < i or original in stored) for i, original in enumerate(originals)]
+
+        to_embed = [text for text, is_duplicate in zip(texts, duplicate) if not is_duplicate] + list(extra_texts)
+        computed = iter(self.embedding_function.embed_documents(to_embed) if to_embed else [])
+        embeddings = []
+        for i, original in enumerate(originals):
+            if duplicate[i]:
+                embeddings.append(embeddings[position[original]] if position.get(original, i) < i else stored[original])
+                metadatas[i]['duplicate_of'] = original
+            else:
+                embeddings.append(next(computed))
+        embeddings.extend(computed)
+
+        token_counts = [self.chunker.token_counter.count(text) for text in list(texts) + list(extra_texts)]
+        embedded_counts = [count for count, is_duplicate in zip(token_counts, duplicate + [False] * len(extra_texts)) if not is_duplicate]
+        max_batch_tokens = getattr(self.embedding_function, 'max_batch_tokens', QwenEmbeddingFunction.DEFAULT_BATCH_TOKENS)
+        with self._dedup_lock:
+            self.dedup_stats.chunks += len(texts)
+            self.dedup_stats.duplicates += sum(duplicate)
+            self.dedup_stats.tokens_saved += sum(token_counts) - sum(embedded_counts)
+            self.dedup_stats.api_calls_saved += (
+                sum(1 for _ in QwenEmbeddingFunction.pack_batches(token_counts, max_batch_tokens=max_batch_tokens))
+                - sum(1 for _ in QwenEmbeddingFunction.pack_batches(embedded_counts, max_batch_tokens=max_batch_tokens)))
+        return embeddings, signatures
+
+    def _dedup_collection(self, client: VectorStore) -> str:
+        """ 切分在近似重复索引中所属的集合。 """
+        return 'note' if client is self.note_client else 'document'
+
+    def get_dedup_index(self) -> NearDuplicateIndex:
+        """
+        获取近似重复索引：首次使用时读取保存的签名，与向量库的切分数不一致时从向量库重建。
+        
+        :return: NearDuplicateIndex 实例
+        """
+        with self._dedup_lock:
+            if self._dedup_index is not None:
+                return self._dedup_index
+            index = NearDuplicateIndex(os.path.join(self.persist_directory, "dedup.db") if self.persist_directory else ":memory:",
+                                       threshold=self.dedup_threshold)
+            if len(index) != sum(client.count() for client in (self.document_client, self.note_client)):
+                index.clear()
+                for client in (self.document_client, self.note_client):
+                    results = client.get(include=["documents"])
+                    index.add(self._dedup_collection(client), results['ids'], index.signatures(results['documents']))
+            self._dedup_index = index
+            return index
+
+    def report_dedup_stats(self) -> None:
+        """ 打印最近一次入库的去重统计。 """
+        stats = self.dedup_stats
+        if self.dedup_threshold > 0 and stats.chunks:
+            print(f"近似重复切分: {stats.duplicates}/{stats.chunks}, 去重率 {stats.ratio:.1%}, "
+                  f"少嵌入 {stats.tokens_saved} tokens, 约少调用嵌入接口 {stats.api_calls_saved} 次")
+
+    def _update_chunk_metadatas(self, client: VectorStore, ids: List[str], metadatas: List[dict]) -> None:
+        """ 更新切分的元数据并同步关键字索引，不重新嵌入。 """
+        client.update_metadatas(ids, metadatas)
+        self._bump_version()
+        self.get_keyword_index().update_metadatas(ids, metadatas)
+
+    def _bump_version(self) -> None:
+        """ 知识库有写入时增加版本号，检索结果缓存随之失效。 """
+        with self._version_lock:
+            self.version += 1
+
+    def get_keyword_index(self) -> BM25Index:
+        """
+        获取关键字索引：首次使用时读取保存的词频重建倒排表，与向量库不一致时从向量库重新分词建立。
+        
+        :return: BM25Index 实例
+        """
+        with self._keyword_index_lock:
+            if self._keyword_index is not None:
+                return self._keyword_index
+            chunk_count = sum(client.count() for client in (self.document_client, self.note_client))
+            try:
+                index = BM25Index(self._keyword_index_path)
+            except Exception as e:
+                print(f"读取关键字索引失败，将重建: {e}")
+                os.remove(self._keyword_index_path)
+                index = BM25Index(self._keyword_index_path)
+            if len(index) != chunk_count:
+                index.clear()
+                for client in (self.document_client, self.note_client):
+                    results = client.get(include=["documents", "metadatas"])
+                    index.add(results['ids'], results['documents'], results['metadatas'])
+                index.save()
+            self._keyword_index = index
+            return index
+
+    def save_keyword_index(self) -> None:
+        """ 保存关键字索引的改动，入库和删除操作结束时调用。 """
+        if self._keyword_index is not None:
+            self._keyword_index.save()
+
+    def _get_chunks(self, ids: List[str], doc_type: str = 'all') -> Dict[str, Document]:
+        """
+        按id从向量库读取切分，关键字索引不保存切分文本。
+
+        :param ids: 切分id
+        :param doc_type: 切分所在的文档类型，'all', 'note' 或 'document'
+        :return: 切分id -> 切分，不存在的id不出现在结果中
+        """
+        chunks = {}
+        if not ids:
+            return chunks
+        for client in self._chunk_clients(doc_type):
+            results = client.get(ids=ids, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+                chunks[chunk_id] = Document(id=chunk_id, page_content=text, metadata=metadata)
+        return chunks
+
+    def _add_summary(self, document_path: str, doc_type: str, summary: str, embedding: Optional[List[float]] = None) -> None:
+        """ 写入文档摘要，摘要写入成功才视为文档已入库。 """
+        self._add_chunks(self.summary_client, [self.summary_id(document_path, doc_type)], [summary],
+                         [{'source': document_path, 'type': doc_type}], [embedding] if embedding is not None else None)
 
     # 检查文档是否存在
     def document_exists(self, document_path: str, doc_type: str) -> bool:
@@ -206,83 +829,235 @@ class DocumentProcessor:
         :param doc_type: 文档类型，'note' 或 'document' 或 'all'
         :return: 如果文档已存在，返回True；否则返回False
         """
-        if doc_type == "all":
-            results = self.summary_client.get(where={'source': document_path})
-        else:
-            results = self.summary_client.get(where={'$and': [{'source': document_path}, {'type': doc_type}]})
-        return len(results['ids']) > 0
+        return document_path in self.catalog.get_many([document_path], doc_type)
+
+    def documents_exist(self, document_paths: List[str], doc_type: str) -> Dict[str, bool]:
+        """
+        批量检查文档是否已存在，只查询一次文档目录。
+        
+        :param document_paths: 文档路径列表
+        :param doc_type: 文档类型，'note' 或 'document' 或 'all'
+        :return: {文档路径: 是否存在}
+        """
+        existing = self.catalog.get_many(document_paths, doc_type)
+        return {document_path: document_path in existing for document_path in document_paths}
     
     # 删除指定文档及其摘要
     def delete_document(self, document_paths: Union[str, List[str]], doc_type: str) -> None:
-            """
-            删除指定文档及其摘要。
-            
-            :param document_paths: 要删除的文档的路径，可以是单个路径（str）或多个路径（list）
-            :param doc_type: 文档类型，'note' 或 'document'
-            """
-            self.validate_doc_type(doc_type)
-            
-            if isinstance(document_paths, str):
-                document_paths = [document_paths]
-
-            for document_path in document_paths:
-                try:
-                    # 获取要删除的摘要的ID
-                    summary_results = self.summary_client.get(where={'$and': [{'source': document_path}, {'type': doc_type}]}, include=[])
-                    summary_ids = summary_results.get('ids', [])
-
-                    # 获取要删除的文档切分的ID
-                    client = self.note_client if doc_type == 'note' else self.document_client
-                    document_results = client.get(where={'source': document_path}, include=[])
-                    document_ids = document_results.get('ids', [])
-
-                    # 删除摘要和切分
-                    if summary_ids or document_ids:
-                        if summary_ids:
-                            self.summary_client.delete(ids=summary_ids)
-                        if document_ids:
-                            client.delete(ids=document_ids)
-                        print(f"成功删除文档: {document_path}")
-                    else:
-                        print(f"未找到文档: {document_path}")
-                except Exception as e:
-                    print(f"删除文档时出错: {document_path}, 错误: {e}")
-                    
-    def query(self, query: str, doc_type: str = 'all') -> List[dict]:
-        """
-        查询文档。
+        """
+        删除指定文档及其摘要。
+        
+        :param document_paths: 要删除的文档的路径，可以是单个路径（str）或多个路径（list）
+        :param doc_type: 文档类型，'note' 或 'document'
+        """
+        if isinstance(document_paths, str):
+            document_paths = [document_paths]
+        for document_path, result in self.delete_documents(document_paths, doc_type).items():
+            if result == 'deleted':
+                print(f"成功删除文档: {document_path}")
+            elif result == 'not_found':
+                print(f"未找到文档: {document_path}")
+            else:
+                print(f"删除文档时出错: {document_path}, 错误: {result}")
+
+    # 批量删除文档
+    def delete_documents(self, document_paths: List[str], doc_type: str) -> Dict[str, str]:
+        """
+        批量删除文档及其摘要：每个集合只做一次 source $in 查询和一次批量删除，适合一次清理大量文档。
+        
+        :param document_paths: 要删除的文档路径列表
+        :param doc_type: 文档类型，'note'、'document' 或 'all'
+        :return: {文档路径: 结果}，结果为 'deleted'、'not_found' 或错误信息
+        """
+        self.validate_doc_type(doc_type)
+        entries = self.catalog.get_many(document_paths, doc_type)
+        results = {document_path: 'deleted' if document_path in entries else 'not_found' for document_path in document_paths}
+
+        # 按集合分组，摘要id直接从文档目录获取
+        sources_by_type: Dict[str, List[str]] = {}
+        summary_ids_by_type: Dict[str, List[str]] = {}
+        for document_path, document_entries in entries.items():
+            for entry in document_entries:
+                sources_by_type.setdefault(entry['type'], []).append(document_path)
+                summary_ids_by_type.setdefault(entry['type'], []).append(entry['summary_id'])
+
+        for source_type, sources in sources_by_type.items():
+            client = self.note_client if source_type == 'note' else self.document_client
+            try:
+                chunk_ids = client.get(where={'source': {'$in': sources}}, include=[])['ids']
+                if chunk_ids:
+                    self._delete_chunks(client, chunk_ids)
+                self._delete_chunks(self.summary_client, summary_ids_by_type[source_type])
+                self.catalog.remove(sources, source_type)
+            except Exception as e:
+                for source in sources:
+                    results[source] = str(e)
+
+        if entries:
+            self.save_keyword_index()
+        return results
+
+    def query(self, query: str, doc_type: str = 'all', k: int = 4, summary_k: int = 1, per_source: bool = False,
+              mmr: bool = False, fetch_k: int = 20, lambda_mult: float = 0.5, score_threshold: Optional[float] = None,
+              strategy: Optional[str] = None) -> List[Document]:
+        """
+        查询文档。各阶段耗时记录在 self.last_query_timings 中。
         
         :param query: 查询字符串
         :param doc_type: 文档类型，'all', 'note' 或 'document'
+        :param k: 返回的切分数
+        :param summary_k: 'summary' 和 'both' 策略中通过摘要选出的文档数
+        :param per_source: 为 True 时按旧方式对每个文档单独检索k个切分（仅 'summary' 策略）；
+                           默认每个集合只检索一次（source 使用 $in 过滤），'all' 时两个集合并行检索后按距离合并取前k个
+        :param mmr: 为 True 时先取 fetch_k 个候选，再用最大边际相关性重排，去掉内容重复的切分
+        :param fetch_k: 重排的候选数，仅在 mmr 或 score_threshold 生效时使用
+        :param lambda_mult: MMR 的相关性权重，1 为只看相关性，0 为只看多样性
+        :param score_threshold: 与查询的余弦相似度低于该值的切分不返回
+        :param strategy: 检索策略（见 RETRIEVAL_STRATEGIES），默认使用环境变量 retrieval_strategy：
+                         'summary' 先用摘要选出 summary_k 个文档，再在这些文档的切分中检索；
+                         'direct' 直接在全部切分中检索，少一次摘要检索，答案分散在多个文档时也能找到；
+                         'both' 两路都检索，结果用倒数排名融合合并
         :return: 查询结果
         """
         self.validate_doc_type(doc_type)
-        
-        try:
-            document_results = []
-            if doc_type == 'all':
-                # 全局查询
-                summary_results = self.summary_client.search(query, search_type="similarity", k=1)
-                for result in summary_results:
-                    source = result.metadata['source']
-                    if result.metadata['type'] == 'document':
-                        document_results.extend (self.document_client.similarity_search(query,filter = {'source':source}))
-                    else:
-                        document_results.extend(self.note_client.similarity_search(query,filter = {'source':source}))
+        strategy = strategy or self.retrieval_strategy
+        if strategy not in self.RETRIEVAL_STRATEGIES:
+            raise ValueError(f"无效的 strategy: {strategy}. 合法的值有: {', '.join(self.RETRIEVAL_STRATEGIES)}")
 
-            else:
-                # 特定类型查询
-                client = self.note_client if doc_type == 'note' else self.document_client
-                summary_results = self.summary_client.search(query, search_type="similarity", k=1, where={'type': doc_type})
-                sources = [result.metadata['source'] for result in summary_results]
-                for source in sources:
-                    document_results.extend(client.similarity_search(query, filter={'source': source}))
+        # 重复的查询直接返回缓存结果；先读取版本号，检索期间有写入时结果不会被当作最新结果
+        start = time.perf_counter()
+        cache_key = ('query', ResultCache.normalize_query(query), doc_type, k, summary_k, per_source, mmr, fetch_k, lambda_mult, score_threshold, strategy)
+        version = self.version
+        cached = self.result_cache.get(cache_key, version)
+        if cached is not None:
+            self.last_query_timings = {'strategy': strategy, 'cached': True, 'total': time.perf_counter() - start}
+            return list(cached)
 
-            return document_results
+        try:
+            results = self._query(query, doc_type, k, summary_k, per_source, mmr, fetch_k, lambda_mult, score_threshold, strategy)
         except Exception as e:
             print(f"查询时出错: {e}")
             return []
+        self.result_cache.put(cache_key, version, results)
+        return list(results)
+
+    def _query(self, query: str, doc_type: str, k: int, summary_k: int, per_source: bool,
+               mmr: bool, fetch_k: int, lambda_mult: float, score_threshold: Optional[float], strategy: str) -> List[Document]:
+        """ query 的实际检索过程，出错时抛出异常，不写入缓存。 """
+        timings = {'strategy': strategy, 'cached': False}
+        start = stage_start = time.perf_counter()
+
+        def stage_done(stage: str) -> None:
+            nonlocal stage_start
+            now = time.perf_counter()
+            timings[stage] = now - stage_start
+            stage_start = now
+
+        # 查询文本只嵌入一次，摘要检索和切分检索共用同一个向量
+        query_embedding = self.embedding_function.embed_query(query)
+        stage_done('embed')
+
+        summary_searches = []
+        if strategy in ('summary', 'both'):
+            summary_filter = None if doc_type == 'all' else {'type': doc_type}
+            summary_results = self.summary_client.similarity_search_by_vector(query_embedding, k=summary_k, filter=summary_filter)
+
+            # 按集合分组选中的文档
+            sources_by_type: Dict[str, List[str]] = {}
+            for result in summary_results:
+                sources_by_type.setdefault(result.metadata['type'], []).append(result.metadata['source'])
+            stage_done('summary')
+
+            if per_source and strategy == 'summary':
+                document_results = []
+                for source_type, sources in sources_by_type.items():
+                    client = self.note_client if source_type == 'note' else self.document_client
+                    for source in sources:
+                        document_results.extend(client.similarity_search_by_vector(query_embedding, k=k, filter={'source': source}))
+                stage_done('search')
+                timings['total'] = time.perf_counter() - start
+                self.last_query_timings = timings
+                return document_results
+
+            summary_searches = [(self.note_client if source_type == 'note' else self.document_client, {'source': {'$in': sources}})
+                                for source_type, sources in sources_by_type.items()]
+        direct_searches = [(client, None) for client in self._chunk_clients(doc_type)] if strategy in ('direct', 'both') else []
+
+        # 需要重排时候选向量随检索结果一次取回，不再重新嵌入
+        rerank = mmr or score_threshold is not None
+        n_candidates = max(fetch_k, k) if rerank else k
+        search = self._search_candidates if rerank else self._search_collections
+        if strategy == 'both':
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                summary_future = executor.submit(search, summary_searches, query_embedding, n_candidates)
+                direct_candidates = search(direct_searches, query_embedding, n_candidates)
+                summary_candidates = summary_future.result()
+            by_id = {item[0].id: item for item in direct_candidates + summary_candidates}
+            fused = reciprocal_rank_fusion([[item[0].id for item in summary_candidates], [item[0].id for item in direct_candidates]])
+            candidates = [by_id[chunk_id] for chunk_id in fused][:n_candidates]
+        else:
+            candidates = search(summary_searches or direct_searches, query_embedding, n_candidates)
+        stage_done('search')
+
+        if rerank:
+            embeddings = [item[2] for item in candidates]
+            if mmr:
+                selected = mmr_rerank(query_embedding, embeddings, k=k, lambda_mult=lambda_mult, score_threshold=score_threshold)
+            else:
+                selected = threshold_filter(query_embedding, embeddings, k=k, score_threshold=score_threshold)
+            results = [candidates[i][0] for i in selected]
+            stage_done('rerank')
+        else:
+            results = [item[0] for item in candidates[:k]]
+
+        timings['total'] = time.perf_counter() - start
+        self.last_query_timings = timings
+        return results
+
+    def _chunk_clients(self, doc_type: str) -> List[VectorStore]:
+        """ doc_type 对应的切分集合。 """
+        return {'all': [self.document_client, self.note_client], 'note': [self.note_client], 'document': [self.document_client]}[doc_type]
+
+    def _search_collections(self, searches: List[Tuple[VectorStore, Optional[dict]]], query_embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        """
+        在多个集合中检索，多个集合时并行执行，结果按距离合并取前k个。
+        
+        :param searches: (集合, 过滤条件) 列表
+        :param query_embedding: 查询向量
+        :param k: 返回的结果数
+        :return: (切分, 距离) 列表，距离越小越相似
+        """
+        def search(client_and_filter):
+            client, where = client_and_filter
+            return client.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k, filter=where)
+
+        if len(searches) <= 1:
+            results = [search(item) for item in searches]
+        else:
+            with ThreadPoolExecutor(max_workers=len(searches)) as executor:
+                results = list(executor.map(search, searches))
+        return heapq.nsmallest(k, (pair for result in results for pair in result), key=lambda pair: pair[1])
     
+    def _search_candidates(self, searches: List[Tuple[VectorStore, Optional[dict]]], query_embedding: List[float], fetch_k: int) -> List[Tuple[Document, float, List[float]]]:
+        """
+        与 _search_collections 相同，但同时返回切分的向量，供重排使用。
+        
+        :param searches: (集合, 过滤条件) 列表
+        :param query_embedding: 查询向量
+        :param fetch_k: 候选数
+        :return: (切分, 距离, 向量) 列表，按距离升序
+        """
+        def search(client_and_filter):
+            client, where = client_and_filter
+            return client.search_with_embeddings(query_embedding, fetch_k, filter=where)
+
+        if len(searches) <= 1:
+            results = [search(item) for item in searches]
+        else:
+            with ThreadPoolExecutor(max_workers=len(searches)) as executor:
+                results = list(executor.map(search, searches))
+        return heapq.nsmallest(fetch_k, (item for result in results for item in result), key=lambda item: item[1])
+
     def get_document_content(self, document_path: str, doc_type: str = 'all') -> Dict:
         """
         根据文档路径获取文档内容。
@@ -294,20 +1069,16 @@ class DocumentProcessor:
         self.validate_doc_type(doc_type)
         
         try:
-            # 获取文档的摘要信息
-            if doc_type == 'all':
-                summary_results = self.summary_client.get(where={'source': document_path}, include=["metadatas"])
-            else:
-                summary_results = self.summary_client.get(where={'$and': [{'source': document_path}, {'type': doc_type}]}, include=["metadatas"])
-            
-            # 如果没有找到摘要，说明文档不存在
-            if not summary_results.get("metadatas", []):
+            # 从文档目录获取文档信息
+            entries = self.catalog.get_many([document_path], doc_type).get(document_path)
+            if not entries:
                 print(f"未找到文档: {document_path}")
                 return []
+            metadatas = [{'source': entry['source'], 'type': entry['type']} for entry in entries]
 
             # 获取文档片段
             document_results = []
-            for summary in summary_results["metadatas"]:
+            for summary in metadatas:
                 source = summary['source']
                 if summary['type'] == 'document':
                     client = self.document_client
@@ -316,38 +1087,100 @@ class DocumentProcessor:
                 results = client.get(where={'source': source}, include=["documents", "metadatas"])
                 document_results.extend(results.get("documents", []))
 
-            return {'texts':document_results,'metadatas':summary_results["metadatas"]}
+            return {'texts':document_results,'metadatas':metadatas}
 
         except Exception as e:
             print(f"获取文档内容时出错: {e}")
             return {'texts':None,'metadatas':None}
     
+    # 按序号获取相邻切分
+    def get_neighbors(self, chunk: Document, before: int = 1, after: int = 1) -> List[Document]:
+        """
+        按元数据中的序号获取同一文档中与检索结果相邻的切分，用于扩展上下文，不需要再做一次相似度检索。
+        没有序号的切分（按序号入库之前的旧数据）只返回自身。
+
+        :param chunk: 检索得到的切分，元数据需包含 source、type 和 chunk_index
+        :param before: 向前取的切分数
+        :param after: 向后取的切分数
+        :return: 按序号排列的切分，包含 chunk 自身
+        """
+        metadata = chunk.metadata or {}
+        if 'chunk_index' not in metadata or metadata.get('type') not in ('note', 'document'):
+            return [chunk]
+        index = metadata['chunk_index']
+        client = self.note_client if metadata['type'] == 'note' else self.document_client
+        results = client.get(where={'$and': [{'source': metadata['source']},
+                                             {'chunk_index': {'$in': list(range(max(index - before, 0), index + after + 1))}}]},
+                             include=["documents", "metadatas"])
+        neighbors = [Document(id=chunk_id, page_content=text, metadata=chunk_metadata)
+                     for chunk_id, text, chunk_metadata in zip(results['ids'], results['documents'], results['metadatas'])]
+        return sorted(neighbors, key=lambda doc: doc.metadata['chunk_index']) or [chunk]
+
     # 关键字检索
-    def keyword_search(self, keyword: str, doc_type: str = 'all') -> List[dict]:
+    def keyword_search(self, keyword: str, doc_type: str = 'all', k: Optional[int] = None, exact: bool = False,
+                       min_coverage: float = 0.0) -> List[str]:
         """
-        根据关键字检索文档。
+        根据关键字检索文档，默认使用BM25倒排索引按相关度排序。
+        中文按单字和二字组匹配，只共享一个字的切分也会命中，界面搜索应传入 k 和 min_coverage。
         
         :param keyword: 关键字
         :param doc_type: 文档类型，'all', 'note' 或 'document'
-        :return: 匹配的文档列表
+        :param k: 最多返回的结果数，为 None 时返回全部命中
+        :param exact: 为 True 时使用向量库的子串匹配（不排序，逐条扫描）
+        :param min_coverage: 切分至少要包含的查询词项比例，见 BM25Index.search
+        :return: 匹配的切分文本列表
         """
         try:
+            self.validate_doc_type(doc_type)
+            if not exact:
+                ranking = [chunk_id for chunk_id, _ in self.get_keyword_index().search(keyword, k=k, doc_type=doc_type, min_coverage=min_coverage)]
+                chunks = self._get_chunks(ranking, doc_type)
+                return [chunks[chunk_id].page_content for chunk_id in ranking if chunk_id in chunks]
+
             if doc_type == 'all':
                 # 全局查询
                 document_results = self.document_client.get(where_document={"$contains": keyword}, include=["metadatas", "documents"])
                 note_results = self.note_client.get(where_document={"$contains": keyword}, include=["metadatas", "documents"])
                 results = document_results['documents']+ note_results['documents']
             else:
-                self.validate_doc_type(doc_type)
                 # 特定类型查询
                 client = self.note_client if doc_type == 'note' else self.document_client
                 results = client.get(where_document={"$contains": keyword}, include=["metadatas", "documents"])['documents']
 
-            return results
+            return results[:k] if k is not None else results
         except Exception as e:
             print(f"关键字检索时出错: {e}")
             return []
 
+    # 混合检索
+    def hybrid_search(self, query: str, doc_type: str = 'all', k: int = 4, candidates: int = 50, rrf_k: int = 60) -> List[Document]:
+        """
+        BM25与向量检索的混合检索，两路结果用倒数排名融合（RRF）合并。
+        
+        :param query: 查询字符串
+        :param doc_type: 文档类型，'all', 'note' 或 'document'
+        :param k: 返回的切分数
+        :param candidates: 每一路取的候选数
+        :param rrf_k: RRF平滑常数，越大排名靠后的结果权重越高
+        :return: 融合排序后的切分
+        """
+        self.validate_doc_type(doc_type)
+        try:
+            index = self.get_keyword_index()
+            keyword_ranking = [chunk_id for chunk_id, _ in index.search(query, k=candidates, doc_type=doc_type)]
+
+            query_embedding = self.embedding_function.embed_query(query)
+            vector_results = self._search_collections([(client, None) for client in self._chunk_clients(doc_type)], query_embedding, candidates)
+            vector_ranking = [doc.id for doc, _ in vector_results]
+
+            documents = {doc.id: doc for doc, _ in vector_results}
+            fused = reciprocal_rank_fusion([keyword_ranking, vector_ranking], rrf_k)[:k]
+            documents.update(self._get_chunks([chunk_id for chunk_id in fused if chunk_id not in documents], doc_type))
+            return [documents[chunk_id] for chunk_id in fused if chunk_id in documents]
+        except Exception as e:
+            print(f"混合检索时出错: {e}")
+            return []
+
 
 # 示例用法
 if __name__ == "__main__":
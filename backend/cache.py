@@ -0,0 +1,272 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def content_hash(text: str) -> str:
+    """计算文本内容的 sha256 摘要，作为缓存键的一部分。"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# 嵌入向量缓存
+class EmbeddingCache:
+    SQLITE_MAX_VARIABLES = 500  # 单条 IN 查询的参数个数上限
+
+    def __init__(self, db_path: str = "./user_data/embedding_cache.db", max_size_mb: float = 512):
+        """
+        以 (模型, 文本类型, 文本哈希) 为键、float32 二进制为值的磁盘缓存。
+
+        :param db_path: SQLite 数据库路径
+        :param max_size_mb: 向量数据的最大占用空间，超出后按最近最少使用淘汰
+        """
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        # 嵌入在线程池中并发执行，连接需要跨线程共享
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self._create_table_if_not_exists()
+        self.cursor.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings")
+        self.total_size = self.cursor.fetchone()[0]
+
+    def _create_table_if_not_exists(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_type TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_type, text_hash)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)
+        ''')
+        self.conn.commit()
+
+    def get_many(self, model: str, text_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量读取缓存。
+
+        :param model: 嵌入模型名
+        :param text_type: 文本类型，'document' 或 'query'
+        :param texts: 文本列表
+        :return: 与 texts 顺序一致的向量列表，未命中的位置为 None
+        """
+        hashes = [content_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique_hashes), self.SQLITE_MAX_VARIABLES):
+                chunk = unique_hashes[i:i + self.SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                self.cursor.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_type = ? AND text_hash IN ({placeholders})",
+                    (model, text_type, *chunk)
+                )
+                for text_hash, blob in self.cursor.fetchall():
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                # 刷新访问时间，供淘汰策略使用
+                now = time.time()
+                self.cursor.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_type = ? AND text_hash = ?",
+                    [(now, model, text_type, text_hash) for text_hash in found]
+                )
+                self.conn.commit()
+        return [found.get(text_hash) for text_hash in hashes]
+
+    def put_many(self, model: str, text_type: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        批量写入缓存，写入后若超出容量则淘汰最久未访问的向量。
+
+        :param model: 嵌入模型名
+        :param text_type: 文本类型，'document' 或 'query'
+        :param texts: 文本列表
+        :param vectors: 与 texts 一一对应的向量
+        """
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((model, text_type, content_hash(text), blob, len(blob), now))
+        with self._lock:
+            for row in rows:
+                self.cursor.execute(
+                    "SELECT size FROM embeddings WHERE model = ? AND text_type = ? AND text_hash = ?",
+                    row[:3]
+                )
+                existing = self.cursor.fetchone()
+                self.total_size += row[4] - (existing[0] if existing else 0)
+                self.cursor.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text_type, text_hash, vector, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                    row
+                )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        """超出容量时删除最久未访问的条目，直到占用降到上限的90%。"""
+        if self.total_size <= self.max_size_bytes:
+            return
+        target = int(self.max_size_bytes * 0.9)
+        self.cursor.execute("SELECT rowid, size FROM embeddings ORDER BY last_access")
+        to_delete = []
+        for rowid, size in self.cursor.fetchall():
+            if self.total_size <= target:
+                break
+            to_delete.append((rowid,))
+            self.total_size -= size
+        self.cursor.executemany("DELETE FROM embeddings WHERE rowid = ?", to_delete)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.cursor.execute("SELECT COUNT(*) FROM embeddings")
+            return self.cursor.fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cursor.execute("DELETE FROM embeddings")
+            self.conn.commit()
+            self.total_size = 0
+
+    def close(self):
+        self.conn.close()
+
+
+# 摘要缓存
+class SummaryCache:
+    def __init__(self, db_path: str = "./user_data/summary_cache.db"):
+        """
+        以 (模型, 提示词版本, 内容哈希) 为键的摘要缓存，内容不变时可跳过模型调用。
+
+        :param db_path: SQLite 数据库路径
+        """
+        self._lock = threading.Lock()
+        # 分段摘要在线程池中并发执行，连接需要跨线程共享
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self._create_table_if_not_exists()
+
+    def _create_table_if_not_exists(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS summaries (
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, prompt_version, text_hash)
+            )
+        ''')
+        self.conn.commit()
+
+    def get(self, model: str, prompt_version: str, text: str) -> Optional[str]:
+        """
+        读取缓存的摘要。
+
+        :param model: 摘要模型名
+        :param prompt_version: 提示词版本，提示词修改后应同时修改版本号
+        :param text: 原文
+        :return: 摘要，未命中时为 None
+        """
+        with self._lock:
+            self.cursor.execute(
+                "SELECT summary FROM summaries WHERE model = ? AND prompt_version = ? AND text_hash = ?",
+                (model, prompt_version, content_hash(text))
+            )
+            row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def put(self, model: str, prompt_version: str, text: str, summary: str) -> None:
+        with self._lock:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO summaries (model, prompt_version, text_hash, summary, created_at) VALUES (?, ?, ?, ?, ?)",
+                (model, prompt_version, content_hash(text), summary, time.time())
+            )
+            self.conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cursor.execute("DELETE FROM summaries")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# 检索结果缓存
+class ResultCache:
+    def __init__(self, max_size: int = 256, ttl: float = 600):
+        """
+        内存中的检索结果缓存，按最近最少使用淘汰，条目超过 ttl 秒后失效。
+        每个条目记录写入时的知识库版本号，版本号变化（有文档入库或删除）后条目自动失效，不会返回过期结果。
+
+        :param max_size: 最多缓存的条目数，为 0 时不缓存
+        :param ttl: 条目的有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """ 规范化查询文本：去掉首尾空白、合并连续空白并转为小写，只有空白或大小写不同的查询共用一个条目。 """
+        return re.sub(r"\s+", " ", query.strip()).casefold()
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """
+        读取缓存。
+
+        :param key: 缓存键
+        :param version: 当前知识库版本号
+        :return: 缓存的结果，未命中、过期或版本不一致时为 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Hashable, version: int, value: Any) -> None:
+        """
+        写入缓存。
+
+        :param key: 缓存键
+        :param version: 开始检索前读取的知识库版本号，检索期间有写入时该条目下次读取即失效
+        :param value: 检索结果
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,135 @@
+import time
+import sqlite3
+import threading
+
+from typing import Dict, Iterable, List, Optional
+
+
+# 已入库文档的目录
+class DocumentCatalog:
+    SQLITE_MAX_VARIABLES = 500  # 单条 IN 查询的参数个数上限
+    COLUMNS = ('source', 'type', 'content_hash', 'chunk_count', 'summary_id', 'mtime', 'ingested_at')
+
+    def __init__(self, db_path: str = ":memory:"):
+        """
+        记录每个已入库文档的 来源路径、类型、内容哈希、切分数、摘要id、文件修改时间和入库时间。
+        文档列表、是否存在等查询直接读这张表，不必扫描向量库的元数据。
+
+        :param db_path: SQLite 数据库路径
+        """
+        self._lock = threading.Lock()
+        # 流水线入库时多个线程会同时查询，连接需要跨线程共享
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self._create_table_if_not_exists()
+
+    def _create_table_if_not_exists(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT NOT NULL,
+                type TEXT NOT NULL,
+                content_hash TEXT,
+                chunk_count INTEGER NOT NULL,
+                summary_id TEXT NOT NULL,
+                mtime REAL,
+                ingested_at REAL NOT NULL,
+                PRIMARY KEY (source, type)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (type, ingested_at)
+        ''')
+        self.conn.commit()
+
+    def put(self, source: str, doc_type: str, content_hash: Optional[str], chunk_count: int, summary_id: str, mtime: Optional[float] = None) -> None:
+        """
+        写入（或覆盖）一个文档的记录，入库时间为当前时间。
+
+        :param source: 文档路径
+        :param doc_type: 文档类型，'note' 或 'document'
+        :param content_hash: 文档全文的哈希，未知时为 None
+        :param chunk_count: 切分数
+        :param summary_id: 摘要在向量库中的id
+        :param mtime: 文件修改时间，未知时为 None
+        """
+        with self._lock:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO documents (source, type, content_hash, chunk_count, summary_id, mtime, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, doc_type, content_hash, chunk_count, summary_id, mtime, time.time())
+            )
+            self.conn.commit()
+
+    def put_many(self, rows: List[Dict]) -> None:
+        """ 批量写入记录，每项的键与 COLUMNS 相同（ingested_at 可省略）。 """
+        now = time.time()
+        with self._lock:
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO documents (source, type, content_hash, chunk_count, summary_id, mtime, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(row['source'], row['type'], row.get('content_hash'), row['chunk_count'], row['summary_id'], row.get('mtime'), row.get('ingested_at', now))
+                 for row in rows]
+            )
+            self.conn.commit()
+
+    def remove(self, sources: Iterable[str], doc_type: str) -> None:
+        """ 删除记录，doc_type 为 'all' 时删除所有类型。 """
+        sources = list(sources)
+        with self._lock:
+            for i in range(0, len(sources), self.SQLITE_MAX_VARIABLES):
+                chunk = sources[i:i + self.SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                if doc_type == 'all':
+                    self.cursor.execute(f"DELETE FROM documents WHERE source IN ({placeholders})", chunk)
+                else:
+                    self.cursor.execute(f"DELETE FROM documents WHERE type = ? AND source IN ({placeholders})", (doc_type, *chunk))
+            self.conn.commit()
+
+    def get_many(self, sources: Iterable[str], doc_type: str = 'all') -> Dict[str, List[Dict]]:
+        """
+        批量查询文档记录。
+
+        :param sources: 文档路径
+        :param doc_type: 文档类型，'all' 时返回所有类型的记录
+        :return: {文档路径: 记录列表}，未入库的路径不在结果中
+        """
+        unique_sources = list(dict.fromkeys(sources))
+        found: Dict[str, List[Dict]] = {}
+        with self._lock:
+            for i in range(0, len(unique_sources), self.SQLITE_MAX_VARIABLES):
+                chunk = unique_sources[i:i + self.SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                if doc_type == 'all':
+                    self.cursor.execute(f"SELECT {', '.join(self.COLUMNS)} FROM documents WHERE source IN ({placeholders})", chunk)
+                else:
+                    self.cursor.execute(f"SELECT {', '.join(self.COLUMNS)} FROM documents WHERE type = ? AND source IN ({placeholders})", (doc_type, *chunk))
+                for row in self.cursor.fetchall():
+                    entry = dict(zip(self.COLUMNS, row))
+                    found.setdefault(entry['source'], []).append(entry)
+        return found
+
+    def list(self, doc_type: str = 'all') -> List[Dict]:
+        """ 按入库时间列出文档记录。 """
+        with self._lock:
+            if doc_type == 'all':
+                self.cursor.execute(f"SELECT {', '.join(self.COLUMNS)} FROM documents ORDER BY ingested_at")
+            else:
+                self.cursor.execute(f"SELECT {', '.join(self.COLUMNS)} FROM documents WHERE type = ? ORDER BY ingested_at", (doc_type,))
+            return [dict(zip(self.COLUMNS, row)) for row in self.cursor.fetchall()]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """ 各类型的文档数和切分数。 """
+        with self._lock:
+            self.cursor.execute("SELECT type, COUNT(*), COALESCE(SUM(chunk_count), 0) FROM documents GROUP BY type")
+            return {doc_type: {'documents': documents, 'chunks': chunks} for doc_type, documents, chunks in self.cursor.fetchall()}
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.cursor.execute("SELECT COUNT(*) FROM documents")
+            return self.cursor.fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.cursor.execute("DELETE FROM documents")
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
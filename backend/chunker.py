@@ -0,0 +1,128 @@
+import os
+import re
+
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+from .tokenizer import TokenCounter, get_token_counter
+
+
+# 标题行，与 markdown_text 输出的 '# 标题' 形式一致
+_HEADING = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t]*$')
+# 句末位置：中文句末标点（连同后面的引号、括号）、英文句号后接空白、换行
+_SENTENCE_END = re.compile(r'[。！？!?；;…]+[”’」』）)"\']*|\.(?=\s)|\n')
+
+
+@dataclass
+class Chunk:
+    """ 一个切分。start、end 为在原文中的字符位置，text 即 原文[start:end]。 """
+    text: str
+    start: int
+    end: int
+    heading_path: List[str] = field(default_factory=list)
+
+
+# 按结构切分、按token计量大小的切分器
+class StructuredChunker:
+    def __init__(self, max_tokens: int = int(os.getenv("chunk_max_tokens", 400)), token_counter: Optional[TokenCounter] = None):
+        """
+        先按标题分节，节内按段落（空行）装箱，段落超长时按句（中文句末标点、英文句号、换行）切分，单句仍超长时按token硬切。
+        切分不会跨越标题，只有标题而没有正文的节会与下一节合并。大小按token计量，与嵌入接口和模型上下文的预算一致；
+        中文按字符计数时，同样的字符数对应的token数差别很大。
+
+        :param max_tokens: 每个切分的最大token数，节标题行可能使切分略超上限
+        :param token_counter: token计数器，默认使用 tiktoken 的 cl100k_base（离线时按字符估算）
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or get_token_counter()
+
+    @staticmethod
+    def _blocks(text: str) -> Iterator[Tuple[int, int, Optional[Tuple[int, str]]]]:
+        """ 逐行扫描，产出 (起始, 结束, 标题)。标题行的标题为 (级别, 文字)，段落（连续的非空行）为 None。 """
+        position = 0
+        paragraph_start = paragraph_end = None
+        for line in text.splitlines(keepends=True):
+            line_start, position = position, position + len(line)
+            content = line.strip()
+            heading = _HEADING.match(content) if content.startswith('#') else None
+            if not content or heading:
+                if paragraph_start is not None:
+                    yield paragraph_start, paragraph_end, None
+                    paragraph_start = None
+                if heading:
+                    yield line_start, line_start + len(line.rstrip()), (len(heading.group(1)), heading.group(2))
+                continue
+            if paragraph_start is None:
+                paragraph_start = line_start + len(line) - len(line.lstrip())
+            paragraph_end = line_start + len(line.rstrip())
+        if paragraph_start is not None:
+            yield paragraph_start, paragraph_end, None
+
+    def _units(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        """ 把段落拆成不超过 max_tokens 的单元，产出 (起始, 结束, token数)。 """
+        tokens = self.token_counter.count(text[start:end])
+        if tokens <= self.max_tokens:
+            yield start, end, tokens
+            return
+        position = start
+        for match in _SENTENCE_END.finditer(text, start, end):
+            if match.end() > position:
+                yield from self._sentence_units(text, position, match.end())
+            position = match.end()
+        if position < end:
+            yield from self._sentence_units(text, position, end)
+
+    def _sentence_units(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        sentence = text[start:end]
+        if not sentence.strip():
+            return
+        tokens = self.token_counter.count(sentence)
+        if tokens <= self.max_tokens:
+            yield start, end, tokens
+            return
+        for piece in self.token_counter.split(sentence, self.max_tokens):
+            yield start, start + len(piece), self.token_counter.count(piece)
+            start += len(piece)
+
+    def split(self, text: str) -> List[Chunk]:
+        """
+        切分文本。
+
+        :param text: 纯文本，标题为 '# 标题' 形式（Markdown 经 markdown_text 转换后即为这种形式）
+        :return: 按原文顺序排列的切分
+        """
+        chunks: List[Chunk] = []
+        headings: List[Tuple[int, str]] = []  # 当前位置的标题路径
+        start = end = None
+        tokens = 0
+        has_body = False
+        path: List[str] = []
+
+        def flush():
+            nonlocal start, tokens, has_body
+            if start is not None:
+                chunks.append(Chunk(text[start:end], start, end, path))
+            start, tokens, has_body = None, 0, False
+
+        for block_start, block_end, heading in self._blocks(text):
+            if heading is not None:
+                # 新的一节从新的切分开始；上一个切分只有标题时与这一节合并
+                if has_body:
+                    flush()
+                headings = [item for item in headings if item[0] < heading[0]] + [heading]
+                path = [title for _, title in headings]
+                if start is None:
+                    start = block_start
+                end = block_end
+                tokens += self.token_counter.count(text[block_start:block_end])
+                continue
+            for unit_start, unit_end, unit_tokens in self._units(text, block_start, block_end):
+                if has_body and tokens + unit_tokens > self.max_tokens:
+                    flush()
+                if start is None:
+                    start = unit_start
+                    path = [title for _, title in headings]
+                end = unit_end
+                tokens += unit_tokens
+                has_body = True
+        flush()
+        return chunks
@@ -0,0 +1,236 @@
+import re
+import sqlite3
+import threading
+import numpy as np
+
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+
+# 归一化时去掉的字符：空白、标点和下划线，空格、全角半角标点的差异不影响判重
+_NON_WORD = re.compile(r'[\W_]+')
+# 64位哈希的常量（splitmix64 的混合函数）
+_MIX1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX2 = np.uint64(0x94d049bb133111eb)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    x = x ^ (x >> np.uint64(30))
+    x = x * _MIX1
+    x = x ^ (x >> np.uint64(27))
+    x = x * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+@dataclass
+class DedupStats:
+    """ 一次入库的去重统计。 """
+    chunks: int = 0  # 参与判重的切分数
+    duplicates: int = 0  # 与已有切分（或同批中靠前的切分）近似重复、复用了向量的切分数
+    tokens_saved: int = 0  # 未嵌入的切分的token数
+    api_calls_saved: int = 0  # 按嵌入接口的批次上限估算少发的请求数
+
+    @property
+    def ratio(self) -> float:
+        """ 去重率，没有切分时为0。 """
+        return self.duplicates / self.chunks if self.chunks else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), 'ratio': self.ratio}
+
+
+# 近似重复切分的 MinHash LSH 索引
+class NearDuplicateIndex:
+    NUM_PERM = 64  # MinHash 签名长度
+    BANDS = 16  # LSH 分段数，每段 NUM_PERM // BANDS 行
+    SHINGLE = 4  # 按字符 4-gram 计算 Jaccard 相似度
+    MIN_CHARS = 20  # 归一化后短于此长度的文本不参与判重，字符太少时 Jaccard 估计不可靠
+    SEED = 20240601
+
+    def __init__(self, db_path: str = ":memory:", threshold: float = 0.95):
+        """
+        用 MinHash 估计切分之间字符 4-gram 集合的 Jaccard 相似度，用 LSH 分段分桶找候选，
+        只有与新切分至少一段签名完全相同的已有切分才会被比较，查找的开销与库的大小基本无关。
+        16 段 × 4 行时，相似度 0.8 的两个切分成为候选的概率约为 99.9%，0.7 时约为 99%，0.3 时约为 12%，
+        候选再按签名估计的相似度与阈值比较。签名保存在 SQLite 中，加载时在内存中重建分桶。
+
+        改动一个字会替换4个4-gram，约300字的切分中改动 n 处时相似度约为 (300-4n)/(300+4n)：
+        阈值 0.95 只容许一两处改动；阈值 0.8 容许八处左右，只有名称、数字、日期不同的模板段落也会共用一个向量。
+
+        :param db_path: SQLite 数据库路径
+        :param threshold: 判为近似重复所需的最小 Jaccard 相似度
+        """
+        self.threshold = threshold
+        rng = np.random.default_rng(self.SEED)
+        # 乘法移位哈希：(a * x + b) mod 2^64 取高32位，a 为奇数
+        self._a = rng.integers(0, 2 ** 63, self.NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, self.NUM_PERM, dtype=np.uint64)
+        self._shingle_weights = rng.integers(0, 2 ** 63, self.SHINGLE, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._band_weights = rng.integers(0, 2 ** 63, self.NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+        self._lock = threading.Lock()
+        self._signatures: Dict[Tuple[str, str], Optional[np.ndarray]] = {}  # (集合, 切分id) -> 签名，文本太短时为 None
+        # 集合 -> 分段键 -> 切分id，大多数桶只有一个切分，此时直接存id而不是列表，节省内存
+        self._buckets: Dict[str, Dict[int, Union[str, List[str]]]] = {}
+        # 流水线入库时多个线程会同时写入，连接需要跨线程共享
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS signatures (
+                collection TEXT NOT NULL,
+                id TEXT NOT NULL,
+                signature BLOB,
+                PRIMARY KEY (collection, id)
+            )
+        ''')
+        self.conn.commit()
+        self._load()
+
+    def _load(self) -> None:
+        self.cursor.execute("SELECT collection, id, signature FROM signatures")
+        rows = self.cursor.fetchall()
+        for collection, chunk_id, _ in (row for row in rows if row[2] is None):
+            self._signatures[(collection, chunk_id)] = None
+        rows = [row for row in rows if row[2] is not None]
+        if not rows:
+            return
+        signatures = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.uint32).reshape(len(rows), self.NUM_PERM)
+        for (collection, chunk_id, _), signature, keys in zip(rows, signatures, self._band_keys(signatures)):
+            self._insert(collection, chunk_id, signature, keys)
+
+    def __len__(self) -> int:
+        """ 记录的切分数，包括文本太短、不参与判重的切分。 """
+        return len(self._signatures)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        计算文本的 MinHash 签名。
+
+        :param text: 文本
+        :return: NUM_PERM 个 uint32，文本太短时为 None
+        """
+        normalized = _NON_WORD.sub('', text.lower())
+        if len(normalized) < self.MIN_CHARS:
+            return None
+        codes = np.frombuffer(normalized.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        count = len(codes) - self.SHINGLE + 1
+        shingles = codes[:count] * self._shingle_weights[0]
+        for i in range(1, self.SHINGLE):
+            shingles = shingles + codes[i:i + count] * self._shingle_weights[i]
+        shingles = np.unique(_mix(shingles))
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: Iterable[str]) -> List[Optional[np.ndarray]]:
+        return [self.signature(text) for text in texts]
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """ 把每段签名合成一个64位整数作为分桶的键，段号参与计算，不同段的键互不相同。 """
+        rows = self.NUM_PERM // self.BANDS
+        weighted = signatures.astype(np.uint64) * self._band_weights
+        keys = weighted.reshape(len(signatures), self.BANDS, rows).sum(axis=2, dtype=np.uint64)
+        return _mix(keys + np.arange(self.BANDS, dtype=np.uint64))
+
+    def _insert(self, collection: str, chunk_id: str, signature: Optional[np.ndarray], keys: Optional[np.ndarray]) -> None:
+        if (collection, chunk_id) in self._signatures:
+            self._discard(collection, chunk_id)
+        self._signatures[(collection, chunk_id)] = signature
+        if signature is None:
+            return
+        buckets = self._buckets.setdefault(collection, {})
+        for key in keys.tolist():
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = chunk_id
+            elif isinstance(bucket, str):
+                buckets[key] = [bucket, chunk_id]
+            else:
+                bucket.append(chunk_id)
+
+    def _discard(self, collection: str, chunk_id: str) -> None:
+        if (signature := self._signatures.pop((collection, chunk_id), None)) is None:
+            return
+        buckets = self._buckets[collection]
+        for key in self._band_keys(signature[None, :])[0].tolist():
+            bucket = buckets.get(key)
+            if bucket == chunk_id:
+                del buckets[key]
+            elif isinstance(bucket, list) and chunk_id in bucket:
+                bucket.remove(chunk_id)
+                if len(bucket) == 1:
+                    buckets[key] = bucket[0]
+
+    def find(self, collection: str, ids: Sequence[str], signatures: Sequence[Optional[np.ndarray]],
+             exclude: Iterable[str] = ()) -> List[Optional[str]]:
+        """
+        为一批切分查找近似重复的已有切分。同一批中靠后的切分也会与靠前的切分比较。
+
+        :param collection: 集合名，只在同一集合内判重
+        :param ids: 切分id
+        :param signatures: 切分的签名，见 signatures
+        :param exclude: 不参与比较的已有切分id，如重新索引时即将删除的旧切分
+        :return: 每个切分最相似的重复切分的id，没有时为 None
+        """
+        originals: List[Optional[str]] = [None] * len(ids)
+        valid = [i for i, signature in enumerate(signatures) if signature is not None]
+        if not valid:
+            return originals
+        exclude = set(exclude)
+        keys = self._band_keys(np.stack([signatures[i] for i in valid]))
+        batch_buckets: Dict[int, List[int]] = {}
+        with self._lock:
+            buckets = self._buckets.get(collection, {})
+            for i, band_keys in zip(valid, keys.tolist()):
+                signature = signatures[i]
+                best, best_similarity = None, self.threshold
+                candidates = set()
+                for key in band_keys:
+                    bucket = buckets.get(key)
+                    if bucket is not None:
+                        candidates.update((bucket,) if isinstance(bucket, str) else bucket)
+                candidates = [chunk_id for chunk_id in candidates if chunk_id != ids[i] and chunk_id not in exclude]
+                if candidates:
+                    similarities = np.mean(np.stack([self._signatures[(collection, chunk_id)] for chunk_id in candidates]) == signature, axis=1)
+                    if similarities.max() >= best_similarity:
+                        best, best_similarity = candidates[int(similarities.argmax())], float(similarities.max())
+                earlier = [j for j in {j for key in band_keys for j in batch_buckets.get(key, ())} if ids[j] != ids[i]]
+                if earlier:
+                    similarities = np.mean(np.stack([signatures[j] for j in earlier]) == signature, axis=1)
+                    if similarities.max() >= best_similarity:
+                        best, best_similarity = ids[earlier[int(similarities.argmax())]], float(similarities.max())
+                originals[i] = best
+                for key in band_keys:
+                    batch_buckets.setdefault(key, []).append(i)
+        return originals
+
+    def add(self, collection: str, ids: Sequence[str], signatures: Sequence[Optional[np.ndarray]]) -> None:
+        """ 写入切分的签名。签名为 None（文本太短）的切分也会记录，以便与向量库的切分数核对，但不参与判重。 """
+        valid = [signature for signature in signatures if signature is not None]
+        keys = iter(self._band_keys(np.stack(valid)) if valid else ())
+        with self._lock:
+            for chunk_id, signature in zip(ids, signatures):
+                self._insert(collection, chunk_id, signature, next(keys) if signature is not None else None)
+            self.cursor.executemany("INSERT OR REPLACE INTO signatures (collection, id, signature) VALUES (?, ?, ?)",
+                                    [(collection, chunk_id, signature.tobytes() if signature is not None else None)
+                                     for chunk_id, signature in zip(ids, signatures)])
+            self.conn.commit()
+
+    def remove(self, collection: str, ids: Iterable[str]) -> None:
+        """ 删除切分的签名，不存在的id忽略。 """
+        with self._lock:
+            ids = [chunk_id for chunk_id in ids if (collection, chunk_id) in self._signatures]
+            for chunk_id in ids:
+                self._discard(collection, chunk_id)
+            self.cursor.executemany("DELETE FROM signatures WHERE collection = ? AND id = ?", [(collection, chunk_id) for chunk_id in ids])
+            self.conn.commit()
+
+    def clear(self) -> None:
+        """ 清空索引，向量库与索引不一致、需要重建时调用。 """
+        with self._lock:
+            self._signatures.clear()
+            self._buckets.clear()
+            self.cursor.execute("DELETE FROM signatures")
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
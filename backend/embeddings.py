@@ -0,0 +1,89 @@
+import re
+import zlib
+import numpy as np
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+from langchain_core.embeddings import Embeddings
+
+
+# 嵌入后端接口
+class EmbeddingBackend(Embeddings, ABC):
+    """
+    所有嵌入后端的公共接口。子类只需实现 __call__，
+    embed_documents / embed_query 供 Chroma 等 langchain 组件调用。
+
+    注意：不同后端的向量维度不同，切换后端时应使用新的向量库目录。
+    """
+    model: str = ""
+    cache = None
+
+    @abstractmethod
+    def __call__(self, input: List[str], text_type: str = "document") -> List[List[float]]:
+        """ 嵌入一组文本，返回与输入顺序一致的向量。text_type 为 'document' 或 'query'。 """
+
+    @property
+    def hit_rate(self) -> float:
+        return 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self(texts, text_type="document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self([text], text_type="query")[0]
+
+
+# 本地离线嵌入-字符n-gram哈希
+class LocalHashEmbeddingFunction(EmbeddingBackend):
+    WHITESPACE_PATTERN = re.compile(r"\s+")
+    NGRAM_CACHE_SIZE = 200000  # n-gram编码缓存的最大条目数，超出时清空重新积累
+
+    def __init__(self, dim: int = 512, ngram_range: Tuple[int, int] = (1, 3)):
+        """
+        不依赖网络的CPU嵌入：把文本的字符n-gram哈希到固定维度，再做L2归一化。
+        对中文按字符切分天然适用，适合离线测试和大语料的基准评估。
+
+        :param dim: 向量维度
+        :param ngram_range: 使用的n-gram长度范围（闭区间）
+        """
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model = f"local-hash-{dim}-{ngram_range[0]}-{ngram_range[1]}"
+        # n-gram到编码的映射（维度下标*2 + 符号位），避免对重复出现的n-gram反复计算哈希。
+        # 常用字的n-gram反复出现，命中率高；语料中只出现一次的n-gram很多，条目数需要设上限
+        self._ngram_cache: Dict[str, int] = {}
+
+    def _hash_ngram(self, ngram: str) -> int:
+        # 使用 crc32 而不是内置 hash，保证跨进程结果稳定
+        h = zlib.crc32(ngram.encode('utf-8'))
+        code = (h % self.dim) * 2 + (h >> 31)
+        if len(self._ngram_cache) >= self.NGRAM_CACHE_SIZE:
+            self._ngram_cache.clear()
+        self._ngram_cache[ngram] = code
+        return code
+
+    def _ngrams(self, text: str) -> List[str]:
+        text = self.WHITESPACE_PATTERN.sub(" ", text.lower()).strip()
+        ngrams = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            ngrams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+        return ngrams
+
+    def __call__(self, input: List[str], text_type: str = "document") -> List[List[float]]:
+        cache = self._ngram_cache
+        codes, lengths = [], []
+        for text in input:
+            ngrams = self._ngrams(text)
+            # 先取值再判断：其他线程可能在判断和取值之间清空缓存，先判断 in 再取值会抛出 KeyError
+            codes.extend([code if (code := cache.get(g)) is not None else self._hash_ngram(g) for g in ngrams])
+            lengths.append(len(ngrams))
+
+        # 整批一次性累加并归一化
+        codes = np.asarray(codes, dtype=np.int64)
+        rows = np.repeat(np.arange(len(input), dtype=np.int64), lengths)
+        signs = 1.0 - 2.0 * (codes & 1)
+        matrix = np.bincount(rows * self.dim + (codes >> 1), weights=signs, minlength=len(input) * self.dim)
+        matrix = matrix.reshape(len(input), self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+        return matrix.tolist()
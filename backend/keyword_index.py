@@ -0,0 +1,247 @@
+import re
+import json
+import math
+import sqlite3
+import threading
+import numpy as np
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# 连续的中日韩字符，或连续的字母数字
+TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+|[A-Za-z0-9_]+")
+CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文数字按词（小写），中日韩文本按单字加相邻二字组，无需词典即可支持中文检索。
+
+    :param text: 文本
+    :return: 词项列表
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(text):
+        if CJK_PATTERN.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+# BM25倒排索引
+class BM25Index:
+    def __init__(self, db_path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        BM25倒排索引，支持增量添加和删除切分。倒排表在内存中，每个切分占用一个内部行号，
+        删除后行号作废（长度记为0，检索时跳过），作废行过多时在内存中压缩。
+        传入 db_path 时每个切分的元数据和词频保存在 SQLite 中，增删只写入变化的切分，save 时提交，
+        启动时由词频重建倒排表，不必重新分词。切分文本不在索引中重复保存，需要时从向量库读取。
+
+        :param db_path: SQLite 数据库路径，为 None 时只在内存中
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+        self.conn = None
+        if db_path:
+            # 流水线入库时多个线程会同时写入，连接需要跨线程共享
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.cursor = self.conn.cursor()
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    terms TEXT NOT NULL
+                )
+            ''')
+            self.conn.commit()
+            self._load()
+
+    def _reset(self) -> None:
+        self.ids: List[Optional[str]] = []  # 行号 -> 切分id，已删除为 None
+        self.metadatas: List[Optional[dict]] = []
+        self.lengths: List[int] = []  # 已删除为0
+        self.row_of: Dict[str, int] = {}  # 切分id -> 行号
+        self.postings: Dict[str, Dict[int, int]] = {}  # 词项 -> {行号: 词频}，压缩前保留已删除的行
+        self.total_length = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # 词项倒排表的 numpy 缓存
+        self._length_array: Optional[np.ndarray] = None
+        self._type_array: Optional[np.ndarray] = None  # 行号 -> 文档类型，供类型过滤向量化使用
+
+    def _load(self) -> None:
+        self.cursor.execute("SELECT id, metadata, terms FROM chunks ORDER BY rowid")
+        for id_, metadata, terms in self.cursor.fetchall():
+            self._append(id_, json.loads(metadata), json.loads(terms))
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def _append(self, id_: str, metadata: dict, counts: Dict[str, int]) -> None:
+        row = len(self.ids)
+        length = sum(counts.values())
+        self.ids.append(id_)
+        self.metadatas.append(metadata)
+        self.lengths.append(length)
+        self.row_of[id_] = row
+        self.total_length += length
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[row] = tf
+            self._arrays.pop(term, None)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        """
+        添加切分，已存在的id会先删除再添加。
+
+        :param ids: 切分id
+        :param texts: 切分文本
+        :param metadatas: 切分元数据，需包含 source 和 type
+        """
+        counts = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            self.remove(id_ for id_ in ids if id_ in self.row_of)
+            for id_, metadata, term_counts in zip(ids, metadatas, counts):
+                self._append(id_, metadata, term_counts)
+            if self.conn is not None:
+                self.cursor.executemany("INSERT OR REPLACE INTO chunks (id, metadata, terms) VALUES (?, ?, ?)",
+                                        [(id_, json.dumps(metadata, ensure_ascii=False),
+                                          json.dumps(term_counts, ensure_ascii=False, separators=(',', ':')))
+                                         for id_, metadata, term_counts in zip(ids, metadatas, counts)])
+            self._length_array = self._type_array = None
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """
+        删除切分，不存在的id会被忽略。倒排表中的行留到压缩时再清理。
+
+        :param ids: 切分id
+        """
+        with self._lock:
+            removed = []
+            for id_ in list(ids):
+                row = self.row_of.pop(id_, None)
+                if row is None:
+                    continue
+                self.total_length -= self.lengths[row]
+                self.ids[row] = self.metadatas[row] = None
+                self.lengths[row] = 0
+                removed.append(id_)
+            if self.conn is not None and removed:
+                self.cursor.executemany("DELETE FROM chunks WHERE id = ?", [(id_,) for id_ in removed])
+            # 作废行超过一半时压缩
+            if len(self.ids) > 1024 and len(self.row_of) < len(self.ids) // 2:
+                self._compact()
+            self._length_array = self._type_array = None
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]) -> None:
+        """ 只更新元数据（类型不变），不存在的id会被忽略。 """
+        with self._lock:
+            updated = []
+            for id_, metadata in zip(ids, metadatas):
+                row = self.row_of.get(id_)
+                if row is not None:
+                    self.metadatas[row] = metadata
+                    updated.append((json.dumps(metadata, ensure_ascii=False), id_))
+            if self.conn is not None and updated:
+                self.cursor.executemany("UPDATE chunks SET metadata = ? WHERE id = ?", updated)
+
+    def clear(self) -> None:
+        """ 清空索引，与向量库不一致、需要重建时调用。 """
+        with self._lock:
+            self._reset()
+            if self.conn is not None:
+                self.cursor.execute("DELETE FROM chunks")
+                self.conn.commit()
+
+    def _compact(self) -> None:
+        """ 去掉作废行并重新编号，只改动内存中的倒排表。 """
+        alive = [row for row, id_ in enumerate(self.ids) if id_ is not None]
+        new_row = {row: i for i, row in enumerate(alive)}
+        postings = {}
+        for term, posting in self.postings.items():
+            posting = {new_row[row]: tf for row, tf in posting.items() if row in new_row}
+            if posting:
+                postings[term] = posting
+        self.ids = [self.ids[row] for row in alive]
+        self.metadatas = [self.metadatas[row] for row in alive]
+        self.lengths = [self.lengths[row] for row in alive]
+        self.row_of = {id_: row for row, id_ in enumerate(self.ids)}
+        self.postings = postings
+        self._arrays.clear()
+        self._length_array = self._type_array = None
+
+    def _posting_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term)
+            if not posting:
+                return None
+            arrays = (np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                      np.fromiter(posting.values(), dtype=np.float32, count=len(posting)))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, k: Optional[int] = 10, doc_type: str = 'all', sources: Optional[Iterable[str]] = None,
+               min_coverage: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        BM25检索。
+
+        :param query: 查询文本
+        :param k: 返回的结果数，为 None 时返回所有命中的切分
+        :param doc_type: 'all', 'note' 或 'document'
+        :param sources: 只在这些文档中检索
+        :param min_coverage: 切分至少要包含的查询词项比例，为1时须包含全部词项（中文即全部单字和相邻二字组）
+        :return: (切分id, 得分) 列表，按得分降序
+        """
+        with self._lock:
+            n_docs = len(self.row_of)
+            if n_docs == 0:
+                return []
+            if self._length_array is None:
+                self._length_array = np.asarray(self.lengths, dtype=np.float32)
+            avg_length = self.total_length / n_docs
+            norm = self.k1 * (1 - self.b + self.b * self._length_array / max(avg_length, 1e-9))
+
+            terms = set(tokenize(query))
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            matched = np.zeros(len(self.ids), dtype=np.int32)
+            for term in terms:
+                arrays = self._posting_arrays(term)
+                if arrays is None:
+                    continue
+                rows, tfs = arrays
+                # 跳过已删除的行，文档频率只计未删除的切分
+                alive = self._length_array[rows] > 0
+                rows, tfs = rows[alive], tfs[alive]
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+                matched[rows] += 1
+
+            candidates = np.flatnonzero(scores > 0)
+            if min_coverage > 0:
+                candidates = candidates[matched[candidates] >= math.ceil(min_coverage * len(terms))]
+            if doc_type != 'all':
+                if self._type_array is None:
+                    self._type_array = np.array([metadata['type'] if metadata else '' for metadata in self.metadatas])
+                candidates = candidates[self._type_array[candidates] == doc_type]
+            if sources is not None:
+                sources = set(sources)
+                candidates = np.array([row for row in candidates if self.metadatas[row]['source'] in sources], dtype=np.int64)
+            if k is not None and len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(self.ids[row], float(scores[row])) for row in candidates]
+
+    def save(self) -> None:
+        """ 提交上次保存以来的增删，只写入变化的切分，下次启动时不必重新分词。 """
+        with self._lock:
+            if self.conn is not None:
+                self.conn.commit()
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
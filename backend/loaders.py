@@ -0,0 +1,191 @@
+import os
+import sys
+import pickle
+import threading
+import subprocess
+
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+from .markdown_text import markdown_to_text
+
+
+# markdown加载器
+class MarkdownLoader(TextLoader):
+    def __init__(self, file_path: Union[str, Path], encoding: Optional[str] = None, autodetect_encoding: bool = False):
+        """Initialize with file path and optional encoding and autodetection flag."""
+        super().__init__(file_path, encoding=encoding, autodetect_encoding=autodetect_encoding)
+
+    @staticmethod
+    def _remove_markdown(text: str) -> str:
+        """ 将Markdown文本转换为纯文本，去掉 YAML 头信息，标题保留为 '# 标题' 形式。 """
+        return markdown_to_text(text)[1]
+
+    def lazy_load(self) -> Iterator[Document]:
+        """ 加载文件并将Markdown转换为纯文本，笔记头信息中的标题和标签记录在元数据中。 """
+        for doc in super().lazy_load():
+            front_matter, text_content = markdown_to_text(doc.page_content)
+            metadata = dict(doc.metadata)
+            if front_matter.get('title'):
+                metadata['title'] = str(front_matter['title'])
+            if front_matter.get('tags'):
+                tags = front_matter['tags']
+                metadata['tags'] = ", ".join(map(str, tags)) if isinstance(tags, list) else str(tags)
+            yield Document(page_content=text_content, metadata=metadata)
+
+
+# 根据文件类型选择合适的加载器
+def get_loader(document_path: str) -> BaseLoader:
+    """
+    根据文件扩展名创建加载器。
+
+    :param document_path: 文档路径
+    :return: 对应的 langchain 加载器
+    :raises ValueError: 不支持的文档类型
+    """
+    if document_path.endswith('.md'):
+        return MarkdownLoader(document_path, autodetect_encoding=True)
+    elif document_path.endswith('.txt'):
+        return TextLoader(document_path, autodetect_encoding=True)
+    elif document_path.endswith('.pdf'):
+        return PyPDFLoader(document_path)
+    elif document_path.endswith('.docx'):
+        return Docx2txtLoader(document_path)
+    raise ValueError("未知类型文档. 当前仅支持 .md, .txt, .pdf 和 .docx 格式的文档")
+
+
+def load_document(document_path: str) -> List[Document]:
+    """ 完整加载并解析一个文档，返回各页。在解析进程中执行（见 backend.parse_worker）。 """
+    return list(get_loader(document_path).lazy_load())
+
+
+# 多进程文档解析
+class ParserPool:
+    WORKER_MODULE = "backend.parse_worker"
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        在子进程中解析文档。Markdown 转纯文本、PDF 和 docx 的解析都是纯 Python 的 CPU 密集操作，
+        受 GIL 限制，多线程无法利用多核，也会占住调用线程（界面线程）。
+        子进程以 python -m backend.parse_worker 启动，只导入解析库，不重新导入界面程序的主模块，
+        也不继承界面进程中的线程和模型客户端；第一次使用时才启动，之后复用，异常退出的进程会被替换。
+        进程数为1时不创建进程，imap 在一个后台线程中解析，调用方入库当前文档时下一个文档已在解析。
+
+        :param max_workers: 解析进程数，默认为 min(2, CPU 核数)（可用环境变量 parse_workers 设置，为0时取 CPU 核数）
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv("parse_workers", min(2, os.cpu_count() or 1)))
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self._slots = threading.Semaphore(self.max_workers)
+        self._idle: List[subprocess.Popen] = []  # 空闲的解析进程
+        self._workers: List[subprocess.Popen] = []  # 所有存活的解析进程，关闭时使用
+        self._threads: Optional[ThreadPoolExecutor] = None  # imap 用来等待解析结果的线程
+        self._lock = threading.Lock()
+
+    def _start_worker(self) -> subprocess.Popen:
+        # 子进程的导入路径加上项目根目录，python -m 才能找到 backend 包
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+        worker = subprocess.Popen([sys.executable, "-m", self.WORKER_MODULE], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                  env=env, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _discard(self, worker: subprocess.Popen) -> None:
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.kill()
+        worker.wait()
+
+    def _take_idle(self) -> Optional[subprocess.Popen]:
+        """ 取一个空闲的解析进程，跳过空闲期间已经退出的进程。 """
+        while True:
+            with self._lock:
+                worker = self._idle.pop() if self._idle else None
+            if worker is None or worker.poll() is None:
+                return worker
+            self._discard(worker)
+
+    def load(self, document_path: str) -> List[Document]:
+        """
+        解析单个文档，阻塞直到完成。流水线的多个加载线程同时调用时，多个文档在不同进程中并行解析。
+        进程数为1时在调用线程中直接解析。
+
+        :raises Exception: 解析失败时抛出子进程中的异常，解析进程异常退出时抛出 RuntimeError
+        """
+        if self.max_workers == 1:
+            return load_document(document_path)
+        with self._slots:
+            worker = self._take_idle() or self._start_worker()
+            try:
+                pickle.dump(document_path, worker.stdin)
+                worker.stdin.flush()
+                pages, error = pickle.load(worker.stdout)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                self._discard(worker)
+                raise RuntimeError(f"解析进程异常退出: {document_path}") from e
+            with self._lock:
+                self._idle.append(worker)
+        if error is not None:
+            raise error
+        return pages
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="parser")
+            return self._threads
+
+    def imap(self, document_paths: Iterable[str], prefetch: Optional[int] = None) -> Iterator[Tuple[str, Optional[List[Document]], Optional[Exception]]]:
+        """
+        并行解析一组文档，按输入顺序逐个产出结果。调用方处理当前文档时，后面的文档已经在其他进程（或后台线程）中解析。
+        同时提交的文档数有上限，已解析但尚未取走的结果不会无限堆积在内存中。
+
+        :param document_paths: 文档路径
+        :param prefetch: 同时提交的最大文档数，默认为进程数的两倍
+        :return: (文档路径, 各页, 异常) 的迭代器，解析失败时各页为 None
+        """
+        threads = self._get_threads()
+        prefetch = prefetch or 2 * self.max_workers
+        pending = deque()
+        paths = iter(document_paths)
+        try:
+            for document_path in paths:
+                pending.append((document_path, threads.submit(self.load, document_path)))
+                if len(pending) >= prefetch:
+                    break
+            while pending:
+                document_path, future = pending.popleft()
+                try:
+                    result = (document_path, future.result(), None)
+                except Exception as e:
+                    result = (document_path, None, e)
+                # 取走一个结果就补交一个文档，保持进程池满载
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append((next_path, threads.submit(self.load, next_path)))
+                yield result
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的解析
+            for _, future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        """ 等待进行中的解析结束，关闭解析进程。之后再使用时会重新启动。 """
+        with self._lock:
+            threads, self._threads = self._threads, None
+        if threads is not None:
+            threads.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            workers, self._workers, self._idle = self._workers, [], []
+        for worker in workers:
+            # 关闭标准输入后解析进程读到 EOF 退出
+            worker.stdin.close()
+            worker.wait()
+            worker.stdout.close()
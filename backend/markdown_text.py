@@ -0,0 +1,198 @@
+import re
+import html
+import yaml
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# 块级语法，逐行匹配
+_FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_HEADING = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+_SETEXT = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+_RULE = re.compile(r'^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_QUOTE = re.compile(r'^ {0,3}(?:>[ \t]?)+')
+_LIST = re.compile(r'^[ \t]*(?:[-*+]|\d{1,9}[.)])[ \t]+(?:\[[ xX]\][ \t]+)?')
+_TABLE_SEPARATOR = re.compile(r'^[ \t]*\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+_LINK_DEFINITION = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S+')
+
+# 行内语法，一次替换完成
+_INLINE_MARKERS = re.compile(r'[`\[<*_~\\&!]')
+_INLINE = re.compile(r'''
+    (?P<code_fence>`+)(?P<code>.+?)(?P=code_fence)                  # 行内代码
+  | !?\[(?P<link>[^\]]*)\]\([^)]*\)                                 # 链接和图片，保留文字
+  | !?\[(?P<reference>[^\]]+)\]\[[^\]]*\]                           # 引用式链接
+  | <(?P<autolink>(?:https?|ftp|mailto):[^>\s]+)>                   # 自动链接
+  | <!--.*?-->                                                      # 行内注释
+  | </?[A-Za-z][^>]*>                                               # HTML 标签
+  | (?P<star>\*\*|\*|~~)(?=\S)(?P<starred>.+?)(?<=\S)(?P=star)       # 加粗、斜体、删除线
+  | (?<!\w)(?P<under>__|_)(?=\S)(?P<underlined>.+?)(?<=\S)(?P=under)(?!\w)
+  | \\(?P<escaped>[\\`*_{}\[\]()#+\-.!|>~])                         # 转义字符
+''', re.VERBOSE)
+
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def split_front_matter(text: str) -> Tuple[Dict, str]:
+    """
+    分离 YAML 头信息和正文，格式与 NoteManager 保存笔记时相同：第一行为 '---'，到下一个 '---' 行为止。
+    没有头信息（或只有开头的 '---' 而没有结束行，此时是分隔线）时原样返回正文。
+
+    :param text: Markdown 全文
+    :return: (头信息, 正文)，头信息无法解析时为空字典
+    """
+    if not text.startswith('---'):
+        return {}, text
+    first_end = text.find('\n')
+    if first_end == -1 or text[:first_end].rstrip() != '---':
+        return {}, text
+    match = re.search(r'^(?:---|\.\.\.)[ \t]*$', text[first_end + 1:], re.MULTILINE)
+    if match is None:
+        return {}, text
+    start = first_end + 1
+    try:
+        metadata = yaml.load(text[start:start + match.start()], Loader=_YAML_LOADER)
+    except yaml.YAMLError:
+        metadata = None
+    body = text[start + match.end():]
+    return (metadata if isinstance(metadata, dict) else {}), body[1:] if body.startswith('\n') else body
+
+
+def _inline_replace(match: re.Match) -> str:
+    groups = match.groupdict()
+    if groups['code'] is not None:
+        return groups['code'].strip()
+    for name in ('link', 'reference', 'starred', 'underlined'):
+        if groups[name] is not None:
+            return strip_inline(groups[name])
+    if groups['autolink'] is not None:
+        return groups['autolink']
+    if groups['escaped'] is not None:
+        return groups['escaped']
+    return ''
+
+
+def strip_inline(line: str) -> str:
+    """ 去掉一行中的行内语法（强调、链接、行内代码、HTML 标签等），保留文字。 """
+    if _INLINE_MARKERS.search(line) is None:
+        return line
+    line = _INLINE.sub(_inline_replace, line)
+    return html.unescape(line) if '&' in line else line
+
+
+def _table_cells(line: str) -> str:
+    cells = [cell.strip() for cell in line.strip().strip('|').split('|')]
+    return '  '.join(strip_inline(cell) for cell in cells if cell)
+
+
+def iter_text_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    逐行把 Markdown 转为纯文本，只扫描一遍，不构建 HTML 或语法树，可以边读文件边转换。
+
+    保留的结构：标题统一转为 '# 标题' 形式（保留级别，Setext 标题也转为这种形式），前后各空一行；
+    段落、列表、表格、代码块之间空一行。切分器按空行切分时不会把标题和上一节的内容切在一起。
+    去掉的语法：列表符号、引用符号、分隔线、表格分隔行、链接地址、强调符号、HTML 标签和注释、链接定义。
+    代码块内容原样保留。
+
+    :param lines: Markdown 的各行（不含头信息），可以带换行符
+    :return: 纯文本的各行，连续空行只保留一个
+    """
+    pending: Optional[str] = None  # 上一行输出，下一行可能把它变成 Setext 标题或表头
+    pending_is_paragraph = False
+    blank = True  # 上一行输出是否为空行，用于合并连续空行
+    fence: Optional[str] = None
+    in_comment = in_table = False
+
+    def emit(text: str) -> Iterator[str]:
+        nonlocal blank
+        if text:
+            blank = False
+            yield text
+        elif not blank:
+            blank = True
+            yield ''
+
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        out: List[str] = []  # 本行产生的输出
+        is_paragraph = False
+
+        if fence is not None:
+            # 代码块内原样保留，直到出现同样的围栏
+            if line.lstrip(' ').startswith(fence):
+                fence = None
+                out = ['']
+            else:
+                out = [line]
+        elif in_comment:
+            end = line.find('-->')
+            if end == -1:
+                continue
+            in_comment = False
+            line = line[end + 3:]
+            if line.strip():
+                out = [strip_inline(line.strip())]
+        else:
+            if line.lstrip().startswith('>'):
+                line = _QUOTE.sub('', line)
+            stripped = line.strip()
+            comment = stripped.find('<!--')
+            if comment != -1 and stripped.find('-->', comment) == -1:
+                in_comment = True
+                stripped = stripped[:comment].strip()
+
+            if not stripped:
+                in_table = False
+                out = ['']
+            elif (match := _FENCE.match(line)) is not None:
+                fence = match.group(1)[0] * len(match.group(1))
+                out = ['']
+            elif (match := _HEADING.match(line)) is not None:
+                out = ['', f"{match.group(1)} {strip_inline(match.group(2) or '')}".rstrip(), '']
+            elif pending_is_paragraph and _SETEXT.match(line):
+                # 上一行是 Setext 标题的文字
+                pending = None
+                out = ['', f"{'#' if stripped[0] == '=' else '##'} {previous_text}", '']
+            elif _RULE.match(line):
+                out = ['']
+            elif _LINK_DEFINITION.match(line):
+                continue
+            elif _TABLE_SEPARATOR.match(line) and pending is not None and '|' in previous_raw:
+                # 表格分隔行：上一行是表头
+                pending = _table_cells(previous_raw)
+                pending_is_paragraph = False
+                in_table = True
+                continue
+            elif in_table or stripped.startswith('|'):
+                in_table = True
+                out = [_table_cells(stripped)]
+            elif (match := _LIST.match(line)) is not None:
+                out = [strip_inline(line[match.end():].strip())]
+            else:
+                out = [strip_inline(stripped)]
+                is_paragraph = True
+
+        if pending is not None:
+            yield from emit(pending)
+        pending = None
+        # 最后一项暂缓输出，下一行可能需要修改它
+        for text in out[:-1]:
+            yield from emit(text)
+        if out:
+            pending = out[-1]
+            previous_raw = line
+            previous_text = out[-1]
+        pending_is_paragraph = is_paragraph
+
+    if pending is not None:
+        yield from emit(pending)
+
+
+def markdown_to_text(text: str) -> Tuple[Dict, str]:
+    """
+    把 Markdown 文档转为纯文本。
+
+    :param text: Markdown 全文，可以带 YAML 头信息
+    :return: (头信息, 纯文本)
+    """
+    metadata, body = split_front_matter(text)
+    return metadata, '\n'.join(iter_text_lines(body.splitlines())).strip('\n')
@@ -2,13 +2,19 @@ import os
 import yaml
 from datetime import datetime, timezone
 from .VectorStor import DocumentProcessor
+from .resources import get_document_processor
 
 class NoteManager:
-    def __init__(self, notes_directory='./notes', sync_with_knowledge_base=False):
+    def __init__(self, notes_directory='./notes', sync_with_knowledge_base=False, doc_processor: DocumentProcessor = None):
+        """
+        :param notes_directory: 笔记目录
+        :param sync_with_knowledge_base: 是否把笔记同步到知识库
+        :param doc_processor: 知识库实例，默认使用进程内共享的实例
+        """
         self.notes_directory = notes_directory
         os.makedirs(self.notes_directory, exist_ok=True)
         
-        self.doc_processor = DocumentProcessor()
+        self.doc_processor = doc_processor or get_document_processor()
         self.sync_with_knowledge_base = sync_with_knowledge_base
         if self.sync_with_knowledge_base:
             self.sync_notes_with_knowledge_base()
@@ -26,7 +32,10 @@ class NoteManager:
         to_delete = set(knowledge_base_notes) - set(local_notes.values())
         # print(f'删除的知识库：{list(to_delete)}')
         if to_delete:
-            self.doc_processor.delete_document(list(to_delete), doc_type='note')
+            results = self.doc_processor.delete_documents(list(to_delete), doc_type='note')
+            failed = {path: result for path, result in results.items() if result not in ('deleted', 'not_found')}
+            if failed:
+                print(f"同步时删除笔记失败: {failed}")
         
         # 添加未同步的笔记
         to_add = set(local_notes.values()) - set(knowledge_base_notes)
@@ -125,23 +134,29 @@ class NoteManager:
             old_file_name = f"{title}.md"
             old_file_path = os.path.join(self.notes_directory, old_file_name)
             
-            note['title'] = new_title
-            note['content'] = content
-            note['tags'] = tags if tags else note['tags']
-            note['updated_at'] = datetime.now(timezone.utc).isoformat()
-            full_content = self._create_full_content(note, content)
+            # 元数据中不保存正文和文件名，否则正文会在文件中重复一份
+            metadata = {
+                'created_at': note['created_at'],
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'tags': tags if tags else note['tags'],
+                'title': new_title
+            }
+            full_content = self._create_full_content(metadata, content)
             
             new_file_name = f"{new_title}.md"
             new_file_path = os.path.join(self.notes_directory, new_file_name)
             
             if old_file_name != new_file_name:
                 os.rename(old_file_path, new_file_path)
-            if self.sync_with_knowledge_base:
-                self.doc_processor.delete_document(old_file_path, doc_type='note')
-                self.doc_processor.load_and_embed_documents([new_file_path], doc_type='note')
             
             with open(new_file_path, 'w', encoding='utf-8') as f:
                 f.write(full_content)
+
+            # 先写入新内容再同步，标题未变时只重新索引有变化的切分
+            if self.sync_with_knowledge_base:
+                if old_file_path != new_file_path:
+                    self.doc_processor.delete_document(old_file_path, doc_type='note')
+                self.doc_processor.reindex_document(new_file_path, doc_type='note')
             return True
         raise ValueError(f"Note with title '{title}' not found")
 
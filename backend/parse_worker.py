@@ -0,0 +1,35 @@
+"""
+解析进程的入口，由 ParserPool 以 python -m backend.parse_worker 启动。
+只导入解析文档需要的 backend.loaders，不导入界面程序的主模块（PyQt、模型客户端、chroma）。
+从标准输入逐个读取文档路径，把 (各页, 异常) 写到标准输出，二者都用 pickle 编码；标准输入关闭时退出。
+"""
+import sys
+import pickle
+
+from backend.loaders import load_document
+
+
+def main() -> None:
+    requests, responses = sys.stdin.buffer, sys.stdout.buffer
+    # 解析库打印的内容改写到标准错误，标准输出只用于返回结果
+    sys.stdout = sys.stderr
+    while True:
+        try:
+            document_path = pickle.load(requests)
+        except EOFError:
+            return
+        try:
+            result = (load_document(document_path), None)
+        except Exception as e:
+            result = (None, e)
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            # 异常对象无法序列化时只返回错误信息
+            data = pickle.dumps((None, RuntimeError(f"{result[1] or e}")), protocol=pickle.HIGHEST_PROTOCOL)
+        responses.write(data)
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import time
+import queue
+import threading
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from langchain_core.documents import Document
+from .cache import content_hash
+from .dedup import DedupStats
+
+
+SUPPORTED_EXTENSIONS = ('.md', '.txt', '.pdf', '.docx')
+
+
+@dataclass
+class IngestItem:
+    """ 在流水线各阶段之间传递的单个文档。 """
+    path: str
+    doc_type: str
+    pages: List[Document] = field(default_factory=list)
+    summary: Optional[str] = None
+    content_hash: Optional[str] = None
+    chunk_ids: List[str] = field(default_factory=list)
+    chunk_texts: List[str] = field(default_factory=list)
+    chunk_metadatas: List[dict] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+    skipped: bool = False
+    error: Optional[str] = None
+
+
+_STOP = object()
+
+
+# 多文档流水线入库
+class IngestionPipeline:
+    STAGES = ('load', 'summarize', 'split', 'embed', 'write')
+
+    def __init__(self, processor, workers: Optional[Dict[str, int]] = None, queue_size: int = 8):
+        """
+        把入库拆成 加载解析 → 摘要 → 切分 → 嵌入 → 写入 五个阶段，阶段之间用有界队列连接，
+        多个文档同时处于不同阶段，CPU、摘要模型和嵌入api可以同时工作。
+        每个文档会完整加载到内存，单个超大文档请使用 DocumentProcessor.load_and_embed_documents 的流式入库。
+
+        :param processor: DocumentProcessor 实例
+        :param workers: 各阶段的线程数，如 {'summarize': 4}，未指定的阶段使用默认值。
+                        加载阶段的线程只等待解析进程池的结果，默认与解析进程数相同
+        :param queue_size: 阶段间队列的容量，下游处理不过来时上游会阻塞（背压）
+        """
+        self.processor = processor
+        self.workers = {'load': max(2, processor.parser_pool.max_workers), 'summarize': 4, 'split': 1, 'embed': 2, 'write': 1}
+        self.workers.update(workers or {})
+        self.queue_size = queue_size
+        self._busy = {stage: 0.0 for stage in self.STAGES}
+        self._lock = threading.Lock()
+
+    # 各阶段的处理函数
+    def _load(self, item: IngestItem) -> None:
+        item.pages = self.processor.parser_pool.load(item.path)
+
+    def _summarize(self, item: IngestItem) -> None:
+        item.summary = self.processor.summarizer.summarize(page.page_content for page in item.pages)
+
+    def _split(self, item: IngestItem) -> None:
+        item.content_hash = content_hash("".join(self.processor.page_hash_text(page) for page in item.pages))
+        for chunk_id, text, metadata in self.processor.iter_chunks(item.pages, item.path, item.doc_type):
+            item.chunk_ids.append(chunk_id)
+            item.chunk_texts.append(text)
+            item.chunk_metadatas.append(metadata)
+        item.pages = []
+
+    def _embed(self, item: IngestItem) -> None:
+        # 切分和摘要在同一次调用中嵌入，近似重复的切分复用已入库切分的向量。
+        # 同时处于嵌入阶段的文档尚未写入，彼此之间不判重
+        client = self.processor.note_client if item.doc_type == 'note' else self.processor.document_client
+        item.embeddings = self.processor.embed_chunks(client, item.chunk_ids, item.chunk_texts, item.chunk_metadatas, extra_texts=[item.summary])
+
+    def _write(self, item: IngestItem) -> None:
+        self.processor.store_document(item.path, item.doc_type, item.chunk_ids, item.chunk_texts, item.chunk_metadatas,
+                                      item.summary, chunk_embeddings=item.embeddings[:-1], summary_embedding=item.embeddings[-1],
+                                      document_hash=item.content_hash)
+
+    def _worker(self, stage: str, handler: Callable[[IngestItem], None], in_queue: queue.Queue, out_queue: Optional[queue.Queue]) -> None:
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            if item.error is None and not item.skipped:
+                start = time.perf_counter()
+                try:
+                    handler(item)
+                except Exception as e:
+                    item.error = f"{stage}: {e}"
+                with self._lock:
+                    self._busy[stage] += time.perf_counter() - start
+            if out_queue is not None:
+                out_queue.put(item)
+            else:
+                self._finished.append(item)
+
+    def run(self, document_paths: List[str], doc_type: str) -> Dict:
+        """
+        流水线处理一组文档。
+
+        :param document_paths: 文档路径列表
+        :param doc_type: 文档类型，'note' 或 'document'
+        :return: 吞吐量报告，包括文档数、切分数、耗时、docs/s、chunks/s、各阶段累计耗时和去重统计
+        """
+        self.processor.validate_doc_type(doc_type)
+        self.processor.dedup_stats = DedupStats()
+        self._finished: List[IngestItem] = []
+        self._busy = {stage: 0.0 for stage in self.STAGES}
+        handlers = {'load': self._load, 'summarize': self._summarize, 'split': self._split, 'embed': self._embed, 'write': self._write}
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.STAGES]
+
+        start = time.perf_counter()
+        stage_threads = []
+        for i, stage in enumerate(self.STAGES):
+            out_queue = queues[i + 1] if i + 1 < len(self.STAGES) else None
+            threads = [threading.Thread(target=self._worker, args=(stage, handlers[stage], queues[i], out_queue), daemon=True)
+                       for _ in range(max(1, self.workers[stage]))]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        # 一次查询文档目录，已入库的文档直接跳过
+        exists = self.processor.documents_exist(document_paths, doc_type)
+        for path in document_paths:
+            item = IngestItem(path=path, doc_type=doc_type)
+            if exists[path]:
+                print(f"文档已存在于{doc_type}: {path}")
+                item.skipped = True
+            queues[0].put(item)
+        # 逐阶段关闭：上游线程全部退出后，再通知下游线程退出
+        for i, threads in enumerate(stage_threads):
+            for _ in threads:
+                queues[i].put(_STOP)
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        succeeded = [item for item in self._finished if item.error is None and not item.skipped]
+        failed = [item for item in self._finished if item.error is not None]
+        for item in failed:
+            print(f"处理文档时出错: {item.path}, 错误: {item.error}")
+        chunks = sum(len(item.chunk_texts) for item in succeeded)
+        report = {
+            'documents': len(succeeded),
+            'failed': len(failed),
+            'skipped': len(self._finished) - len(succeeded) - len(failed),
+            'chunks': chunks,
+            'seconds': elapsed,
+            'docs_per_second': len(succeeded) / elapsed if elapsed else 0.0,
+            'chunks_per_second': chunks / elapsed if elapsed else 0.0,
+            'stage_busy_seconds': dict(self._busy),
+            'dedup': self.processor.dedup_stats.as_dict(),
+        }
+        print(f"流水线入库完成: {report['documents']}个文档（失败{report['failed']}个）, {chunks}个切分, "
+              f"耗时 {elapsed:.2f}s, {report['docs_per_second']:.2f} docs/s, {report['chunks_per_second']:.1f} chunks/s")
+        self.processor.report_dedup_stats()
+        return report
+
+
+def list_supported_files(directory: str) -> List[str]:
+    """ 递归列出目录下所有支持入库的文件。 """
+    paths = []
+    for root, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(root, filename))
+    return paths
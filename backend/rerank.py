@@ -0,0 +1,83 @@
+import numpy as np
+
+from typing import List, Optional, Sequence
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr_rerank(query_embedding: Sequence[float], candidate_embeddings: Sequence[Sequence[float]], k: int = 4,
+               lambda_mult: float = 0.5, score_threshold: Optional[float] = None) -> List[int]:
+    """
+    最大边际相关性（MMR）重排：在与查询相关的前提下，尽量选出彼此不重复的候选。
+    每轮只做一次矩阵-向量乘法更新"与已选结果的最大相似度"，整体复杂度 O(k·n·d)，没有逐对的 Python 循环。
+
+    :param query_embedding: 查询向量
+    :param candidate_embeddings: 候选向量，形状 (n, d)
+    :param k: 选出的数量
+    :param lambda_mult: 相关性权重，1 为只看相关性，0 为只看多样性
+    :param score_threshold: 与查询的余弦相似度低于该值的候选直接丢弃
+    :return: 选中候选在 candidate_embeddings 中的下标，按选中顺序排列
+    """
+    if len(candidate_embeddings) == 0 or k <= 0:
+        return []
+    candidates = _normalize(np.asarray(candidate_embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    relevance = candidates @ query
+
+    # 相似度阈值过滤
+    pool = np.arange(len(candidates)) if score_threshold is None else np.flatnonzero(relevance >= score_threshold)
+    if len(pool) == 0:
+        return []
+    candidates, relevance = candidates[pool], relevance[pool]
+
+    k = min(k, len(pool))
+    selected = [int(np.argmax(relevance))]
+    max_similarity = candidates @ candidates[selected[0]]
+    available = np.ones(len(pool), dtype=bool)
+    available[selected[0]] = False
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, candidates @ candidates[best], out=max_similarity)
+    return [int(pool[i]) for i in selected]
+
+
+def threshold_filter(query_embedding: Sequence[float], candidate_embeddings: Sequence[Sequence[float]], k: int,
+                     score_threshold: float) -> List[int]:
+    """
+    只按相似度阈值过滤，并按与查询的余弦相似度降序取前k个。
+
+    :param query_embedding: 查询向量
+    :param candidate_embeddings: 候选向量，形状 (n, d)
+    :param k: 返回的数量
+    :param score_threshold: 余弦相似度阈值
+    :return: 保留候选的下标
+    """
+    if len(candidate_embeddings) == 0 or k <= 0:
+        return []
+    relevance = _normalize(np.asarray(candidate_embeddings, dtype=np.float32)) @ _normalize(np.asarray(query_embedding, dtype=np.float32))
+    pool = np.flatnonzero(relevance >= score_threshold)
+    if len(pool) > k:
+        pool = pool[np.argpartition(-relevance[pool], k - 1)[:k]]
+    return [int(i) for i in pool[np.argsort(-relevance[pool], kind='stable')]]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[str]:
+    """
+    倒数排名融合（RRF）：每个结果的得分为各路排名 1/(rrf_k + 名次) 之和，多路都靠前的结果排在最前。
+
+    :param rankings: 多路排序结果，每路为按相关度降序的id列表
+    :param rrf_k: 平滑常数，越大排名靠后的结果权重越高
+    :return: 融合后按得分降序的id列表
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
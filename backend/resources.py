@@ -0,0 +1,56 @@
+import os
+import threading
+import dashscope
+
+from typing import Any, Callable, Dict
+from langchain_core.language_models import BaseChatModel
+from langchain_community.chat_models import ChatTongyi
+from .VectorStor import DocumentProcessor
+
+
+# 进程内共享的资源：界面、笔记和 agent 使用同一个知识库实例和模型客户端，
+# 避免重复打开向量库、创建模型客户端（及其 HTTP 连接池），也避免多个实例之间的索引状态（关键字索引、检索结果缓存）不一致
+_instances: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def get_shared(name: str, factory: Callable[[], Any]) -> Any:
+    """
+    获取共享资源，第一次获取时用 factory 创建，之后返回同一个实例。
+
+    :param name: 资源名
+    :param factory: 创建资源的函数
+    :return: 资源实例
+    """
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def get_summary_llm() -> BaseChatModel:
+    """ 共享的摘要模型客户端，知识库入库时生成文档摘要。 """
+    return get_shared('summary_llm', lambda: ChatTongyi(model="qwen2.5-3b-instruct", api_key=os.getenv("API_KEY")))
+
+
+def _create_document_processor() -> DocumentProcessor:
+    # 嵌入接口使用 dashscope 模块级的密钥，重新创建时同步为当前配置
+    dashscope.api_key = os.getenv("API_KEY")
+    return DocumentProcessor(llm=get_summary_llm())
+
+
+def get_document_processor() -> DocumentProcessor:
+    """ 共享的知识库实例，包含三个向量库集合、嵌入客户端，摘要使用共享的摘要模型客户端。 """
+    return get_shared('document_processor', _create_document_processor)
+
+
+def reset_shared() -> None:
+    """
+    关闭并清空共享资源，下次获取时按当前配置重新创建（如修改 API 密钥后）。
+    之前取得的实例不再可用，持有它们的对象需要重新获取。
+    """
+    with _lock:
+        for instance in _instances.values():
+            if hasattr(instance, 'close'):
+                instance.close()
+        _instances.clear()
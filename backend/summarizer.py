@@ -0,0 +1,140 @@
+import time
+import threading
+
+from typing import Dict, Iterable, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from langchain_core.language_models import BaseChatModel
+from .cache import SummaryCache
+
+
+# 分层摘要（map-reduce）
+class HierarchicalSummarizer:
+    MAP_PROMPT = "请为以下文本生成一个简明扼要的摘要，概括主要观点和关键信息。摘要长度通常150字左右，可以根据实际情况调整：\n{text}"
+    REDUCE_PROMPT = "以下是同一文档不同部分的摘要，请将它们合并为一个简明扼要的整体摘要，概括主要观点和关键信息。摘要长度通常150字左右，可以根据实际情况调整：\n{text}"
+    # 修改上面的提示词后需要同步修改版本号，使旧的缓存失效
+    PROMPT_VERSIONS = {MAP_PROMPT: 'map-v1', REDUCE_PROMPT: 'reduce-v1'}
+
+    def __init__(self, llm: BaseChatModel, segment_chars: int = 6000, fan_out: int = 4, max_workers: int = 4,
+                 cache: Optional[SummaryCache] = None):
+        """
+        长文本先按段并行摘要（map），再把部分摘要按 fan_out 个一组逐层合并（reduce），直到只剩一个。
+        短文本只有一段时，只调用一次模型，与直接摘要等价。
+
+        :param llm: 用于生成摘要的聊天模型
+        :param segment_chars: 每段的最大字符数
+        :param fan_out: 每次合并的部分摘要个数
+        :param max_workers: 同时在途的模型请求数
+        :param cache: 摘要缓存，每次模型调用按 (模型, 提示词版本, 输入内容) 缓存，为 None 时不缓存
+        """
+        self.llm = llm
+        self.segment_chars = segment_chars
+        self.fan_out = max(2, fan_out)
+        self.max_workers = max(1, max_workers)
+        self.cache = cache
+        self.model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or type(llm).__name__
+        self.last_timings: Dict[str, float] = {}
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self._counter_lock = threading.Lock()
+
+    def _invoke(self, prompt: str, text: str) -> str:
+        prompt_version = self.PROMPT_VERSIONS[prompt]
+        if self.cache is not None:
+            cached = self.cache.get(self.model, prompt_version, text)
+            if cached is not None:
+                with self._counter_lock:
+                    self.cache_hits += 1
+                return cached
+
+        with self._counter_lock:
+            self.llm_calls += 1
+        summary = self.llm.invoke(prompt.format(text=text)).content
+        if self.cache is not None:
+            self.cache.put(self.model, prompt_version, text, summary)
+        return summary
+
+    def start(self) -> "SummaryJob":
+        """ 开始一次流式摘要，调用方逐段 feed 文本，最后 result 取得摘要。 """
+        return SummaryJob(self)
+
+    def summarize(self, texts: Iterable[str]) -> str:
+        """
+        对一组连续的文本（如逐页内容）生成整体摘要。
+
+        :param texts: 文本片段，按原文顺序
+        :return: 摘要
+        """
+        job = self.start()
+        for text in texts:
+            job.feed(text)
+        return job.result()
+
+
+class SummaryJob:
+    def __init__(self, summarizer: HierarchicalSummarizer):
+        self.summarizer = summarizer
+        self.executor = ThreadPoolExecutor(max_workers=summarizer.max_workers)
+        # 限制在途的分段数，避免文档读取远快于模型时分段全部堆积在内存中
+        self._in_flight = threading.BoundedSemaphore(summarizer.max_workers * 2)
+        self._buffer: List[str] = []
+        self._buffer_chars = 0
+        self._futures: List[Future] = []
+        self._start = time.perf_counter()
+        self._start_counts = (summarizer.cache_hits, summarizer.llm_calls)
+        self.timings: Dict[str, float] = {}
+
+    def feed(self, text: str) -> None:
+        """ 追加一段原文，缓冲区满一个分段时立即提交摘要。 """
+        segment_chars = self.summarizer.segment_chars
+        while text:
+            room = segment_chars - self._buffer_chars
+            self._buffer.append(text[:room])
+            self._buffer_chars += len(self._buffer[-1])
+            text = text[room:]
+            if self._buffer_chars >= segment_chars:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._buffer_chars:
+            return
+        segment = "\n".join(self._buffer)
+        self._buffer, self._buffer_chars = [], 0
+        self._in_flight.acquire()
+        future = self.executor.submit(self.summarizer._invoke, HierarchicalSummarizer.MAP_PROMPT, segment)
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(future)
+
+    def cancel(self) -> None:
+        """ 放弃本次摘要，取消尚未开始的分段。 """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def result(self) -> str:
+        """ 等待所有分段完成并逐层合并，返回最终摘要，各阶段耗时记录在 timings 中。 """
+        summarizer = self.summarizer
+        try:
+            self._flush()
+            if not self._futures:
+                self._futures.append(self.executor.submit(summarizer._invoke, HierarchicalSummarizer.MAP_PROMPT, ""))
+            partials = [future.result() for future in self._futures]
+            map_done = time.perf_counter()
+
+            levels = 0
+            while len(partials) > 1:
+                groups = ["\n\n".join(partials[i:i + summarizer.fan_out]) for i in range(0, len(partials), summarizer.fan_out)]
+                partials = list(self.executor.map(lambda group: summarizer._invoke(HierarchicalSummarizer.REDUCE_PROMPT, group), groups))
+                levels += 1
+            reduce_done = time.perf_counter()
+        finally:
+            self.executor.shutdown(wait=False)
+
+        self.timings = summarizer.last_timings = {
+            'segments': len(self._futures),
+            'levels': levels,
+            'map': map_done - self._start,
+            'reduce': reduce_done - map_done,
+            'total': reduce_done - self._start,
+            # 并发执行多个摘要任务时，这两个计数可能包含其他任务的调用
+            'cache_hits': summarizer.cache_hits - self._start_counts[0],
+            'llm_calls': summarizer.llm_calls - self._start_counts[1],
+        }
+        return partials[0]
@@ -0,0 +1,83 @@
+import math
+import tiktoken
+
+from functools import lru_cache
+from typing import List, Tuple
+
+
+# token计数与按token切分
+class TokenCounter:
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        """
+        使用 tiktoken 统计 token 数。DashScope 模型的分词器与之不完全一致，
+        因此调用方应在接口上限之下预留余量。
+        tiktoken 首次使用需要下载编码文件，离线时退化为按字符估算。
+
+        :param encoding_name: tiktoken 编码名
+        """
+        try:
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"加载tiktoken编码失败，改为按字符估算token数: {e}")
+            self.encoding = None
+
+    @staticmethod
+    def _estimate_char_tokens(text: str) -> List[float]:
+        """ 估算每个字符对应的token数：非ASCII字符（如中文）按1个，ASCII字符按1/3个。 """
+        return [1.0 if ord(ch) > 127 else 1 / 3 for ch in text]
+
+    def count(self, text: str) -> int:
+        """
+        统计文本的token数。
+
+        :param text: 文本
+        :return: token数
+        """
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(sum(self._estimate_char_tokens(text)))
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """
+        把文本切成每段不超过 max_tokens 个token的若干段，切分点总是落在字符边界上。
+
+        :param text: 文本
+        :param max_tokens: 每段的最大token数
+        :return: 切分后的文本列表，未超长时返回只包含原文本的列表
+        """
+        return [piece for piece, _ in self.split_with_counts(text, max_tokens)]
+
+    def split_with_counts(self, text: str, max_tokens: int) -> List[Tuple[str, int]]:
+        """
+        与 split 相同，同时返回每段的token数。文本只编码一次，计数与切分共用同一次编码的结果。
+
+        :param text: 文本
+        :param max_tokens: 每段的最大token数
+        :return: (段落文本, token数) 列表
+        """
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return [(text, len(tokens))]
+            # 通过每个token的起始字符位置确定切分点，避免把多字节字符切坏
+            _, offsets = self.encoding.decode_with_offsets(tokens)
+            starts = [i for i in range(max_tokens, len(tokens), max_tokens) if offsets[i] > 0]
+            token_bounds = [0] + starts + [len(tokens)]
+            bounds = [0] + [offsets[i] for i in starts] + [len(text)]
+            return [(text[start:end], token_end - token_start)
+                    for start, end, token_start, token_end in zip(bounds, bounds[1:], token_bounds, token_bounds[1:]) if start < end]
+
+        pieces, start, budget = [], 0, 0.0
+        for i, cost in enumerate(self._estimate_char_tokens(text)):
+            if budget + cost > max_tokens and i > start:
+                pieces.append((text[start:i], math.ceil(budget)))
+                start, budget = i, 0.0
+            budget += cost
+        pieces.append((text[start:], math.ceil(budget)))
+        return pieces
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = "cl100k_base") -> TokenCounter:
+    """ 进程内共享同一个 TokenCounter，避免重复加载编码文件。 """
+    return TokenCounter(encoding_name)
@@ -3,7 +3,7 @@ from .VectorStor import DocumentProcessor
 from .note import NoteManager
 from langchain.tools import BaseTool
 import datetime
-from typing import List, Any
+from typing import List, Any, Optional
 import json
 
 class TodoManagerTool(BaseTool):
@@ -103,6 +103,8 @@ class KnowledgeTool(BaseTool):
     name: str = "知识库检索"
     description: str = "一个用来检索知识库中相似文本的工具"
     knowledge_base:DocumentProcessor
+    mmr: bool = False  # 为 True 时用最大边际相关性重排，避免内容重复的片段占满上下文
+    score_threshold: Optional[float] = None  # 相似度低于该值的片段不返回
 
     def _run(self, query: str) -> List[str]:
         """
@@ -111,7 +113,7 @@ class KnowledgeTool(BaseTool):
         :param query: 查询的问题
         :return: 匹配的文档片段列表
         """
-        documents = self.knowledge_base.query(query,'all')
+        documents = self.knowledge_base.query(query, 'all', mmr=self.mmr, score_threshold=self.score_threshold)
         
         return [doc.page_content for doc in documents]
 
@@ -0,0 +1,425 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+# Chroma 向量库
+class ChromaStore(Chroma):
+    """
+    在 langchain Chroma 上补充 DocumentProcessor 需要的几个接口，与 FlatVectorStore 保持一致。
+    """
+
+    def add_embeddings(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str], metadatas: List[dict]) -> None:
+        """ 写入已计算好的向量，不再调用嵌入。 """
+        self._collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]) -> None:
+        """ 只更新元数据，不重新嵌入。 """
+        self._collection.update(ids=ids, metadatas=metadatas)
+
+    def search_with_embeddings(self, embedding: List[float], k: int, filter: Optional[dict] = None) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        向量检索，同时返回切分的向量，供重排使用。
+
+        :return: (切分, 距离, 向量) 列表，按距离升序
+        """
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, where=filter,
+                                        include=["documents", "metadatas", "distances", "embeddings"])
+        return [(Document(id=chunk_id, page_content=text, metadata=metadata or {}), distance, vector)
+                for chunk_id, text, metadata, distance, vector in zip(result['ids'][0], result['documents'][0], result['metadatas'][0],
+                                                                      result['distances'][0], result['embeddings'][0])]
+
+
+# 内存映射的精确向量库
+class FlatVectorStore:
+    FILTER_KEYS = ('source', 'type', 'chunk_index')  # 支持过滤的元数据字段
+    SQLITE_MAX_VARIABLES = 500
+    QUANTIZATIONS = ('none', 'float16', 'int8')
+    SCAN_BLOCK_ROWS = 4096  # 量化向量分块转换为 float32 后再做矩阵乘法，块大小控制临时内存
+
+    def __init__(self, collection_name: str, persist_directory: Optional[str] = None, embedding_function: Optional[Embeddings] = None,
+                 quantization: str = os.getenv("vector_quantization", "none"), rescore_factor: int = 4):
+        """
+        精确（暴力）检索的向量库：向量以 float32 矩阵存放在内存映射文件中，检索时做一次矩阵乘法再用 argpartition 取前k个。
+        文本和元数据存放在 SQLite 中，source 和 type 在内存中编码为整数数组，过滤同样是向量化的。
+        适合几万个切分以内的个人知识库，接口与 ChromaStore 一致，距离同为欧氏距离的平方。
+
+        开启量化后，另存一份 float16 或 int8（每个向量一个缩放系数）的向量，检索分两步：
+        先在量化向量上近似打分取 k*rescore_factor 个候选，再读取这些候选的 float32 向量精确重排。
+        常驻内存的只有量化向量，float32 文件只在重排时按行读取。
+        需要节省内存时用 int8：numpy 把 float16 转为 float32 是逐元素的软件转换，float16 的检索比不量化慢数倍，
+        而 int8 重排后的召回与 float16 相同、内存只有其一半。float16 仅为兼容已有的配置保留。
+
+        :param collection_name: 集合名
+        :param persist_directory: 存放目录，为 None 时只保存在内存中
+        :param embedding_function: 嵌入函数，add_texts 时使用
+        :param quantization: 'none'、'float16' 或 'int8'，修改后首次打开时会从 float32 向量重新生成量化向量
+        :param rescore_factor: 量化检索时精确重排的候选数为 k 的多少倍
+        """
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"无效的 quantization: {quantization}. 合法的值有: {', '.join(self.QUANTIZATIONS)}")
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._vector_fd: Optional[int] = None  # 开启量化时重排用的 float32 向量文件
+        self._directory = os.path.join(persist_directory, "flat", collection_name) if persist_directory else None
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self._directory, "chunks.db") if self._directory else ":memory:", check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self._create_table_if_not_exists()
+        self._load()
+
+    def _create_table_if_not_exists(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    # 启动时加载：向量文件只做内存映射，不读入内存
+    def _load(self) -> None:
+        self.cursor.execute("SELECT key, value FROM info")
+        info = dict(self.cursor.fetchall())
+        self.dim: Optional[int] = int(info['dim']) if 'dim' in info else None
+        self.cursor.execute("SELECT row, id, metadata FROM chunks ORDER BY row")
+        rows = self.cursor.fetchall()
+        self.ids: List[str] = [chunk_id for _, chunk_id, _ in rows]
+        self.row_of: Dict[str, int] = {chunk_id: row for row, chunk_id, _ in rows}
+        self._codes: Dict[str, Dict[str, int]] = {key: {} for key in self.FILTER_KEYS}  # 元数据值 -> 整数编码
+        self._columns: Dict[str, np.ndarray] = {key: np.empty(max(len(rows), 16), dtype=np.int32) for key in self.FILTER_KEYS}
+        for row, _, metadata in rows:
+            self._set_columns(row, json.loads(metadata))
+        self._arrays: Dict[str, np.ndarray] = {}
+        if self.dim is None:
+            return
+        self._remove_unused_files()
+        self._open_arrays(max(len(rows), 16))
+        # 旧版本的向量库没有范数文件；量化方式与上次写入时不同时量化向量也已失效，都从 float32 向量重新计算
+        stale = []
+        if info.get('norms') != '1':
+            stale.append('norms')
+        if self.quantization != 'none' and info.get('quantization') != self.quantization:
+            stale.append('quantized')
+        if stale:
+            self._rebuild(stale)
+        self._save_info()
+
+    def _array_specs(self) -> Dict[str, Tuple[str, type, Tuple[int, ...]]]:
+        """ 各数组的 (文件名, 类型, 每行形状)。 """
+        specs = {'vectors': ('vectors.f32', np.float32, (self.dim,)), 'norms': ('norms.f32', np.float32, ())}
+        if self.quantization == 'float16':
+            specs['codes'] = ('vectors.f16', np.float16, (self.dim,))
+        elif self.quantization == 'int8':
+            specs['codes'] = ('vectors.i8', np.int8, (self.dim,))
+            specs['scales'] = ('scales.f32', np.float32, ())
+        return specs
+
+    def _remove_unused_files(self) -> None:
+        """ 删除当前量化方式用不到的量化文件。 """
+        if self._directory is None:
+            return
+        used = {filename for filename, _, _ in self._array_specs().values()}
+        for filename in ('vectors.f16', 'vectors.i8', 'scales.f32'):
+            path = os.path.join(self._directory, filename)
+            if filename not in used and os.path.exists(path):
+                os.remove(path)
+
+    def _open_arrays(self, capacity: int) -> None:
+        """ 打开（或扩容）各数组，容量不足时按两倍增长。 """
+        for name, (filename, dtype, row_shape) in self._array_specs().items():
+            old = self._arrays.get(name)
+            if self._directory is None:
+                array = np.zeros((capacity,) + row_shape, dtype=dtype)
+                if old is not None:
+                    array[:len(self.ids)] = old[:len(self.ids)]
+            else:
+                if isinstance(old, np.memmap):
+                    old.flush()
+                path = os.path.join(self._directory, filename)
+                row_bytes = np.dtype(dtype).itemsize * int(np.prod(row_shape))
+                with open(path, 'ab') as f:
+                    if f.tell() < capacity * row_bytes:
+                        f.truncate(capacity * row_bytes)
+                array = np.memmap(path, dtype=dtype, mode='r+', shape=(os.path.getsize(path) // row_bytes,) + row_shape)
+                if name == 'vectors' and self.quantization != 'none' and self._vector_fd is None:
+                    self._vector_fd = os.open(path, os.O_RDONLY)
+            self._arrays[name] = array
+
+    def _capacity(self) -> int:
+        return min(len(array) for array in self._arrays.values())
+
+    def _quantize(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        """ 计算一批向量的量化结果。int8 按每个向量的最大绝对值缩放到 [-127, 127]。 """
+        if self.quantization == 'float16':
+            return {'codes': vectors.astype(np.float16)}
+        if self.quantization == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return {'codes': np.rint(vectors / scales[:, None]).astype(np.int8), 'scales': scales.astype(np.float32)}
+        return {}
+
+    def _write_rows(self, start: int, vectors: np.ndarray, names: Sequence[str] = ('vectors', 'norms', 'quantized')) -> None:
+        end = start + len(vectors)
+        if 'vectors' in names:
+            self._arrays['vectors'][start:end] = vectors
+        if 'norms' in names:
+            self._arrays['norms'][start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        if 'quantized' in names:
+            for name, values in self._quantize(vectors).items():
+                self._arrays[name][start:end] = values
+
+    def _rebuild(self, names: Sequence[str]) -> None:
+        """ 分块读取 float32 向量，重新计算范数或量化向量。 """
+        n = len(self.ids)
+        for start in range(0, n, self.SCAN_BLOCK_ROWS):
+            block = np.asarray(self._arrays['vectors'][start:min(start + self.SCAN_BLOCK_ROWS, n)])
+            self._write_rows(start, block, names)
+
+    def _save_info(self) -> None:
+        self.cursor.executemany("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+                                [('dim', str(self.dim)), ('norms', '1'), ('quantization', self.quantization)])
+        self._flush()
+
+    def _set_columns(self, row: int, metadata: dict) -> None:
+        for key in self.FILTER_KEYS:
+            column = self._columns[key]
+            if row >= len(column):
+                column = self._columns[key] = np.concatenate([column, np.empty(len(column), dtype=np.int32)])
+            codes = self._codes[key]
+            column[row] = codes.setdefault(str(metadata.get(key)), len(codes))
+
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """ 把 Chroma 风格的过滤条件（等值、$eq、$in、$and、$or）转换为行掩码，None 表示不过滤。 """
+        if not where:
+            return None
+        n = len(self.ids)
+        if '$and' in where or '$or' in where:
+            masks = [self._mask(condition) for condition in where.get('$and', where.get('$or'))]
+            masks = [mask if mask is not None else np.ones(n, dtype=bool) for mask in masks]
+            return np.logical_and.reduce(masks) if '$and' in where else np.logical_or.reduce(masks)
+        mask = np.ones(n, dtype=bool)
+        for key, condition in where.items():
+            if key not in self.FILTER_KEYS:
+                raise ValueError(f"FlatVectorStore 仅支持按 {', '.join(self.FILTER_KEYS)} 过滤，收到: {key}")
+            if isinstance(condition, dict):
+                values = condition.get('$in', [condition.get('$eq')] if '$eq' in condition else None)
+                if values is None:
+                    raise ValueError(f"不支持的过滤条件: {condition}")
+            else:
+                values = [condition]
+            codes = [self._codes[key][str(value)] for value in values if str(value) in self._codes[key]]
+            mask &= np.isin(self._columns[key][:n], codes)
+        return mask
+
+    def _fetch(self, rows: Sequence[int]) -> Dict[int, Tuple[str, str, dict]]:
+        """ 从 SQLite 中读取行的 (id, 文本, 元数据)。 """
+        found = {}
+        rows = [int(row) for row in rows]
+        for i in range(0, len(rows), self.SQLITE_MAX_VARIABLES):
+            chunk = rows[i:i + self.SQLITE_MAX_VARIABLES]
+            self.cursor.execute(f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(chunk))})", chunk)
+            for row, chunk_id, document, metadata in self.cursor.fetchall():
+                found[row] = (chunk_id, document, json.loads(metadata))
+        return found
+
+    def add_texts(self, texts: List[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        embeddings = self.embedding_function.embed_documents(list(texts))
+        self.add_embeddings(ids, embeddings, list(texts), metadatas or [{} for _ in texts])
+        return ids
+
+    def add_embeddings(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str], metadatas: List[dict]) -> None:
+        """ 写入已计算好的向量，已存在的id会被覆盖。 """
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self.delete([chunk_id for chunk_id in ids if chunk_id in self.row_of])
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._open_arrays(max(len(ids), 16))
+                self._save_info()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致: {vectors.shape[1]} != {self.dim}")
+            start, end = len(self.ids), len(self.ids) + len(ids)
+            if end > self._capacity():
+                self._open_arrays(max(end, 2 * self._capacity()))
+            self._write_rows(start, vectors)
+            for offset, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+                self._set_columns(start + offset, metadata)
+                self.row_of[chunk_id] = start + offset
+            self.ids.extend(ids)
+            self.cursor.executemany(
+                "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(start + offset, chunk_id, document, json.dumps(metadata, ensure_ascii=False))
+                 for offset, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+            )
+            self._flush()
+
+    def delete(self, ids: Optional[List[str]] = None) -> None:
+        """ 删除切分：把最后一行移动到被删除的位置，矩阵始终保持连续。 """
+        with self._lock:
+            for chunk_id in ids or []:
+                row = self.row_of.pop(chunk_id, None)
+                if row is None:
+                    continue
+                last = len(self.ids) - 1
+                self.cursor.execute("DELETE FROM chunks WHERE row = ?", (row,))
+                if row != last:
+                    moved_id = self.ids[last]
+                    for array in list(self._arrays.values()) + list(self._columns.values()):
+                        array[row] = array[last]
+                    self.ids[row] = moved_id
+                    self.row_of[moved_id] = row
+                    self.cursor.execute("UPDATE chunks SET row = ? WHERE row = ?", (row, last))
+                self.ids.pop()
+            self._flush()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]) -> None:
+        """ 只更新元数据，不存在的id会被忽略。 """
+        with self._lock:
+            rows = [(self.row_of[chunk_id], metadata) for chunk_id, metadata in zip(ids, metadatas) if chunk_id in self.row_of]
+            for row, metadata in rows:
+                self._set_columns(row, metadata)
+            self.cursor.executemany("UPDATE chunks SET metadata = ? WHERE row = ?",
+                                    [(json.dumps(metadata, ensure_ascii=False), row) for row, metadata in rows])
+            self._flush()
+
+    def _flush(self) -> None:
+        """ 向量文件和 SQLite 一起落盘。 """
+        for array in self._arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+        self.conn.commit()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, where_document: Optional[dict] = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Optional[list]]:
+        """ 按id、元数据或文本子串（where_document 的 $contains）读取切分，include 可包含 embeddings，返回格式与 Chroma.get 相同。 """
+        with self._lock:
+            mask = self._mask(where)
+            rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self.ids))
+            if ids is not None:
+                wanted = {self.row_of[chunk_id] for chunk_id in ids if chunk_id in self.row_of}
+                rows = [row for row in rows if row in wanted]
+            if where_document or include:
+                found = self._fetch(rows)
+                if where_document:
+                    keyword = where_document['$contains']
+                    rows = [row for row in rows if keyword in found[row][1]]
+            return {
+                'ids': [self.ids[row] for row in rows],
+                'documents': [found[row][1] for row in rows] if "documents" in include else None,
+                'metadatas': [found[row][2] for row in rows] if "metadatas" in include else None,
+                'embeddings': (list(self._read_vectors(np.asarray(rows, dtype=np.int64))) if len(rows) else []) if "embeddings" in include else None,
+            }
+
+    def _approximate_dot(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """ 用量化向量分块计算与查询的内积，rows 为 None 时计算全部行。 """
+        codes = self._arrays['codes']
+        total = len(self.ids) if rows is None else len(rows)
+        dots = np.empty(total, dtype=np.float32)
+        for start in range(0, total, self.SCAN_BLOCK_ROWS):
+            end = min(start + self.SCAN_BLOCK_ROWS, total)
+            block = codes[start:end] if rows is None else codes[rows[start:end]]
+            dots[start:end] = block.astype(np.float32) @ query
+        if 'scales' in self._arrays:
+            dots *= self._arrays['scales'][:total] if rows is None else self._arrays['scales'][rows]
+        return dots
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """
+        读取若干行的 float32 向量。开启量化时用 pread 逐行读文件而不经过内存映射：
+        映射的页面会计入进程的常驻内存，内核还会把相邻的行一并映射进来，重排读几十行就可能映射上百MB。
+        """
+        vectors = self._arrays['vectors']
+        if self._vector_fd is None:
+            return np.asarray(vectors[rows])
+        row_bytes = self.dim * 4
+        result = np.empty((len(rows), self.dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            result[i] = np.frombuffer(os.pread(self._vector_fd, row_bytes, int(row) * row_bytes), dtype=np.float32)
+        return result
+
+    def search_with_embeddings(self, embedding: Sequence[float], k: int, filter: Optional[dict] = None) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        检索，同时返回切分的向量。未开启量化时为精确检索，开启量化时先近似打分再精确重排。
+
+        :param embedding: 查询向量
+        :param k: 返回的结果数
+        :param filter: 过滤条件，支持 source 和 type
+        :return: (切分, 欧氏距离的平方, 向量) 列表，按距离升序
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            n = len(self.ids)
+            if n == 0 or k <= 0:
+                return []
+            mask = self._mask(filter)
+            rows = None if mask is None else np.flatnonzero(mask)
+            total = n if rows is None else len(rows)
+            vectors, norms = self._arrays['vectors'], self._arrays['norms']
+
+            # 第一步：在量化向量上近似打分，只保留 k*rescore_factor 个候选
+            n_candidates = k * self.rescore_factor
+            if self.quantization != 'none' and total > n_candidates:
+                approximate = (norms[:n] if rows is None else norms[rows]) - 2 * self._approximate_dot(rows, query)
+                top = np.argpartition(approximate, n_candidates - 1)[:n_candidates]
+                rows = top if rows is None else rows[top]
+
+            # 第二步：用 float32 向量计算精确距离
+            if rows is None:
+                distances = norms[:n] - 2 * (vectors[:n] @ query)
+                rows = np.arange(n)
+            else:
+                distances = norms[rows] - 2 * (self._read_vectors(rows) @ query)
+            if len(rows) > k:
+                top = np.argpartition(distances, k - 1)[:k]
+                rows, distances = rows[top], distances[top]
+            order = np.argsort(distances, kind='stable')
+            rows, distances = rows[order], distances[order] + float(query @ query)
+            found = self._fetch(rows)
+            return [(Document(id=found[row][0], page_content=found[row][1], metadata=found[row][2]), float(distance), vector)
+                    for row, distance, vector in zip(rows, distances, self._read_vectors(rows))]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: Sequence[float], k: int = 4, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        return [(doc, distance) for doc, distance, _ in self.search_with_embeddings(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        return [doc for doc, _, _ in self.search_with_embeddings(embedding, k, filter)]
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self.conn.close()
+            if self._vector_fd is not None:
+                os.close(self._vector_fd)
+                self._vector_fd = None
+
+
+# DocumentProcessor 中集合的类型
+VectorStore = Union[ChromaStore, FlatVectorStore]
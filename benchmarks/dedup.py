@@ -0,0 +1,133 @@
+"""
+近似重复切分去重基准：在带模板段落的语料上对比关闭与开启去重时的嵌入请求数、嵌入文本数和检索召回。
+
+语料中每个文档有若干节独有的内容（每节一条可查询的事实），另有若干节从少量模板复制而来
+（免责声明、联系方式等），复制时替换文档编号并随机改动个别字；另有一部分文档是前面某个文档的修订版，
+每节随机改动个别字。这些段落与已入库的段落近似但不完全相同，嵌入缓存按文本精确匹配，命中不了。
+
+- 请求数：DashScope 嵌入接口用本地模拟服务（benchmarks.fake_dashscope）代替，统计实际收到的请求数和文本数
+- 召回：用本地嵌入（local）入库，用事实查询检验来源文档（或其修订版）是否出现在前 k 个切分中，
+  重复的切分复用已有切分的向量，阈值过低时不同的内容也可能被当作重复，召回随之下降
+
+运行（项目根目录）：
+    python -m benchmarks.dedup --docs 200 --copies 0.2 --thresholds 0.95 0.9 0.8
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from backend.VectorStor import DocumentProcessor, QwenEmbeddingFunction
+from benchmarks.fake_dashscope import fake_dashscope
+from benchmarks.stubs import StubChatModel
+
+
+WORDS = "知识 检索 向量 摘要 文档 笔记 嵌入 模型 查询 索引 数据 系统 用户 问题 方法 服务 流程 规范 版本 审核".split()
+TEMPLATE_TITLES = "免责声明 版权说明 联系方式 修订记录 术语表 使用许可 安全须知 反馈渠道".split()
+
+
+def make_corpus(directory: str, docs: int, sections: int, templated: int, templates: int, edits: int, copies: float, seed: int = 0) -> list:
+    """
+    生成语料。
+
+    :return: 事实查询列表 [(查询, 来源文档及其修订版的路径集合)]
+    """
+    rng = random.Random(seed)
+
+    def sentence(n: int) -> str:
+        return "".join(rng.choice(WORDS) for _ in range(n)) + "。"
+
+    def edit(text: str) -> str:
+        characters = list(text)
+        for _ in range(edits):
+            characters[rng.randrange(len(characters))] = rng.choice("的了和与在是")
+        return "".join(characters)
+
+    bodies = [" ".join(sentence(25) for _ in range(4)) + "文档编号 {doc}。" for _ in range(templates)]
+    documents, queries = [], []
+    for i in range(docs):
+        path = os.path.join(directory, f"doc_{i:04d}.md")
+        if documents and rng.random() < copies:
+            # 修订版：复制前面的某个文档，每节改动个别字，查询答案不变
+            original, sections_text = rng.choice(documents)
+            lines = [f"# 文档 {i}", ""] + [edit(section) for section in sections_text]
+            for query, sources in queries:
+                if original in sources:
+                    sources.add(path)
+        else:
+            sections_text = []
+            for j in range(sections):
+                fact = f"项目{i}-{j}的负责人是{''.join(rng.choice('安柏辰德恩枫歌禾嘉景凯岚霖茂宁') for _ in range(3))}"
+                sections_text.append(f"## 第{j}节\n\n{sentence(20)}{fact}。{sentence(20)}\n")
+                queries.append((fact.split("的负责人")[0] + "的负责人是谁", {path}))
+            for t in rng.sample(range(templates), templated):
+                sections_text.append(f"## {TEMPLATE_TITLES[t % len(TEMPLATE_TITLES)]}\n\n{edit(bodies[t].format(doc=i))}\n")
+            documents.append((path, sections_text))
+            lines = [f"# 文档 {i}", ""] + sections_text
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    return queries
+
+
+def new_processor(embedding_backend, threshold: float) -> DocumentProcessor:
+    # 不使用摘要缓存，也不在项目目录下创建缓存文件
+    os.environ["summary_cache_path"] = ""
+    processor = DocumentProcessor(persist_directory=tempfile.mkdtemp(), embedding_backend=embedding_backend,
+                                  llm=StubChatModel(), vector_store_backend='flat')
+    processor.dedup_threshold = threshold
+    return processor
+
+
+def ingest(processor: DocumentProcessor, paths: list) -> tuple:
+    start = time.perf_counter()
+    processor.load_and_embed_documents(paths, doc_type='document')
+    return time.perf_counter() - start, processor.dedup_stats
+
+
+def recall(processor: DocumentProcessor, queries: list, k: int) -> float:
+    hits = 0
+    for query, sources in queries:
+        results = processor.query(query, doc_type='document', k=k, strategy='direct')
+        hits += any(doc.metadata['source'] in sources for doc in results)
+    return hits / len(queries)
+
+
+def run(docs: int, sections: int, templated: int, templates: int, edits: int, copies: float, thresholds: list, k: int) -> None:
+    corpus = tempfile.mkdtemp()
+    queries = make_corpus(corpus, docs, sections, templated, templates, edits, copies)
+    paths = sorted(os.path.join(corpus, name) for name in os.listdir(corpus))
+    processor = None
+
+    rows = []
+    for name, value in [('关闭去重', 0.0)] + [(f'去重(阈值{threshold})', threshold) for threshold in thresholds]:
+        with fake_dashscope(latency=0.0, dim=64) as server:
+            processor = new_processor(QwenEmbeddingFunction(cache_path=None), value)
+            seconds, stats = ingest(processor, paths)
+            requests, texts = server.request_count, server.text_count
+        local = new_processor('local', value)
+        ingest(local, paths)
+        rows.append((name, seconds, requests, texts, stats, recall(local, queries, k)))
+
+    chunks = processor.document_client.count()
+    print()
+    print(f"{docs}个文档（约{copies:.0%}为修订版）, {chunks}个切分, 每个文档{templated}节来自{templates}个模板, "
+          f"复制时每节改动{edits}个字, 查询{len(queries)}条")
+    print(f"{'模式':<14} {'耗时(s)':>8} {'请求数':>6} {'嵌入文本数':>10} {'去重率':>7} {'少嵌入tokens':>12} {'估算少请求':>10} {f'recall@{k}':>9}")
+    for name, seconds, requests, texts, stats, hit_rate in rows:
+        print(f"{name:<14} {seconds:>8.2f} {requests:>6} {texts:>10} {stats.ratio:>7.1%} {stats.tokens_saved:>12} "
+              f"{stats.api_calls_saved:>10} {hit_rate:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=4, help="每个文档独有的节数")
+    parser.add_argument('--templated', type=int, default=3, help="每个文档来自模板的节数")
+    parser.add_argument('--templates', type=int, default=6)
+    parser.add_argument('--edits', type=int, default=3, help="复制模板或文档时每节随机改动的字数")
+    parser.add_argument('--copies', type=float, default=0.2, help="修订版文档的比例")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.95, 0.9, 0.8])
+    parser.add_argument('--k', type=int, default=4)
+    args = parser.parse_args()
+    run(args.docs, args.sections, args.templated, args.templates, args.edits, args.copies, args.thresholds, args.k)
@@ -0,0 +1,37 @@
+"""
+嵌入吞吐量基准：对比串行与并发请求 QwenEmbeddingFunction 的耗时。
+
+运行（项目根目录）：
+    python -m benchmarks.embedding_throughput --chunks 2000 --latency 0.2
+"""
+import time
+import argparse
+
+from backend.VectorStor import QwenEmbeddingFunction
+from benchmarks.fake_dashscope import fake_dashscope
+
+
+def run(chunks: int, latency: float, workers_list, fail_every: int = 0) -> None:
+    texts = [f"第{i}个文本块：用于测试嵌入吞吐量的示例内容。" for i in range(chunks)]
+    print(f"文本块数: {chunks}, 模拟延迟: {latency * 1000:.0f}ms, 每{fail_every or '∞'}个请求失败一次")
+    print(f"{'workers':>8} {'耗时(s)':>10} {'chunks/s':>10} {'请求数':>8} {'加速比':>8}")
+    baseline = None
+    for workers in workers_list:
+        with fake_dashscope(latency=latency, fail_every=fail_every) as server:
+            embedder = QwenEmbeddingFunction(max_workers=workers, retry_backoff=0.01, cache_path=None)
+            start = time.perf_counter()
+            embeddings = embedder(texts)
+            elapsed = time.perf_counter() - start
+        assert len(embeddings) == len(texts)
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {chunks / elapsed:>10.0f} {server.request_count:>8} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+    run(args.chunks, args.latency, args.workers, args.fail_every)
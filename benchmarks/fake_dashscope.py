@@ -0,0 +1,115 @@
+"""
+本地模拟的 DashScope 文本嵌入接口，用于在没有网络和 API 额度的情况下做基准测试。
+
+用法：
+    with fake_dashscope(latency=0.05) as server:
+        ...  # 此时 dashscope.TextEmbedding.call 会请求本地服务
+        print(server.request_count)
+"""
+import json
+import time
+import zlib
+import dashscope
+import multiprocessing
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """根据文本内容生成确定性的伪向量，相同文本总是得到相同向量。"""
+    seed = zlib.crc32(text.encode('utf-8'))
+    # 只让前几维随文本变化，避免模拟服务自身的计算开销掩盖网络延迟
+    head = [((seed >> shift) & 0xff) / 255.0 for shift in (0, 8, 16, 24)]
+    return (head + [0.5] * dim)[:dim]
+
+
+class FakeDashScopeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.05, dim: int = 1536, fail_every: int = 0, counters=None):
+        """
+        :param latency: 每个请求的模拟往返延迟（秒）
+        :param dim: 返回向量的维度
+        :param fail_every: 每隔多少个请求返回一次 500 错误，0 表示不出错
+        :param counters: 跨进程共享的 [请求数, 文本数] 计数器
+        """
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.dim = dim
+        self.fail_every = fail_every
+        self.counters = counters if counters is not None else multiprocessing.Array('l', 2)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server: FakeDashScopeServer = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        texts = body['input']['texts']
+        with server.counters.get_lock():
+            server.counters[0] += 1
+            request_no = server.counters[0]
+        time.sleep(server.latency)
+
+        if server.fail_every and request_no % server.fail_every == 0:
+            status, payload = 500, {'code': 'InternalError', 'message': 'fake failure', 'request_id': str(request_no)}
+        else:
+            with server.counters.get_lock():
+                server.counters[1] += len(texts)
+            status, payload = 200, {
+                'output': {'embeddings': [{'text_index': i, 'embedding': fake_embedding(t, server.dim)} for i, t in enumerate(texts)]},
+                'usage': {'total_tokens': sum(len(t) for t in texts)},
+                'request_id': str(request_no),
+            }
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(latency, dim, fail_every, counters, port_queue):
+    server = FakeDashScopeServer(latency=latency, dim=dim, fail_every=fail_every, counters=counters)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeDashScope:
+    """运行在独立进程中的模拟服务，避免与被测代码争抢 GIL。"""
+
+    def __init__(self, latency: float, dim: int, fail_every: int):
+        self.counters = multiprocessing.Array('l', 2)
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=(latency, dim, fail_every, self.counters, port_queue), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{port_queue.get(timeout=10)}/api/v1"
+
+    @property
+    def request_count(self) -> int:
+        return self.counters[0]
+
+    @property
+    def text_count(self) -> int:
+        return self.counters[1]
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.join()
+
+
+@contextmanager
+def fake_dashscope(latency: float = 0.05, dim: int = 1536, fail_every: int = 0):
+    """启动本地模拟服务，并在退出时恢复 dashscope 的原始地址。"""
+    server = FakeDashScope(latency=latency, dim=dim, fail_every=fail_every)
+    original_url, original_key = dashscope.base_http_api_url, dashscope.api_key
+    dashscope.base_http_api_url = server.url
+    dashscope.api_key = original_key or 'fake-key'
+    try:
+        yield server
+    finally:
+        dashscope.base_http_api_url, dashscope.api_key = original_url, original_key
+        server.stop()
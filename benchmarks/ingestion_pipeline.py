@@ -0,0 +1,65 @@
+"""
+多文档入库基准：对比逐个文档串行入库与流水线入库的吞吐量。
+摘要模型和 DashScope 嵌入接口都用本地替身模拟延迟。
+
+运行（项目根目录）：
+    python -m benchmarks.ingestion_pipeline --docs 40 --llm-latency 0.5 --embed-latency 0.2
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from backend.VectorStor import DocumentProcessor, QwenEmbeddingFunction
+from benchmarks.fake_dashscope import fake_dashscope
+from benchmarks.stubs import StubChatModel
+
+
+def make_corpus(directory: str, docs: int, paragraphs: int) -> None:
+    rng = random.Random(0)
+    words = "知识 检索 向量 摘要 文档 笔记 嵌入 模型 查询 索引 数据 系统 用户 问题 方法".split()
+    for i in range(docs):
+        with open(os.path.join(directory, f"doc_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            for _ in range(paragraphs):
+                f.write("".join(rng.choice(words) for _ in range(80)) + "。\n\n")
+
+
+def new_processor(persist_directory: str, llm_latency: float) -> DocumentProcessor:
+    # 不使用摘要缓存，也不在项目目录下创建缓存文件
+    os.environ["summary_cache_path"] = ""
+    return DocumentProcessor(persist_directory=persist_directory,
+                             embedding_backend=QwenEmbeddingFunction(cache_path=None),
+                             llm=StubChatModel(latency=llm_latency))
+
+
+def run(docs: int, paragraphs: int, llm_latency: float, embed_latency: float) -> None:
+    corpus = tempfile.mkdtemp()
+    make_corpus(corpus, docs, paragraphs)
+    paths = sorted(os.path.join(corpus, name) for name in os.listdir(corpus))
+
+    with fake_dashscope(latency=embed_latency, dim=256):
+        processor = new_processor(tempfile.mkdtemp(), llm_latency)
+        start = time.perf_counter()
+        processor.load_and_embed_documents(paths, doc_type='document')
+        sequential = time.perf_counter() - start
+        chunks = len(processor.document_client.get(include=[])['ids'])
+
+        processor = new_processor(tempfile.mkdtemp(), llm_latency)
+        report = processor.ingest_directory(corpus, doc_type='document')
+
+    print()
+    print(f"{'模式':<8} {'耗时(s)':>8} {'docs/s':>8} {'chunks/s':>10}")
+    print(f"{'串行':<8} {sequential:>8.2f} {docs / sequential:>8.2f} {chunks / sequential:>10.1f}")
+    print(f"{'流水线':<8} {report['seconds']:>8.2f} {report['docs_per_second']:>8.2f} {report['chunks_per_second']:>10.1f}")
+    print("各阶段累计耗时(s):", {stage: round(seconds, 2) for stage, seconds in report['stage_busy_seconds'].items()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=40)
+    parser.add_argument('--paragraphs', type=int, default=20)
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--embed-latency', type=float, default=0.2)
+    args = parser.parse_args()
+    run(args.docs, args.paragraphs, args.llm_latency, args.embed_latency)
@@ -0,0 +1,94 @@
+"""
+关键字检索基准：在合成切分上对比BM25倒排索引与逐条子串扫描（原 $contains 检索的做法）的查询延迟，
+并统计持久化的开销：删除一个文档的切分后保存，以及重新启动时加载索引的耗时。
+
+运行（项目根目录）：
+    python -m benchmarks.keyword_search --chunks 100000 --queries 200
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+
+from backend.keyword_index import BM25Index
+
+
+WORDS = ("知识 检索 向量 摘要 文档 笔记 嵌入 模型 查询 索引 数据 系统 用户 问题 方法 "
+         "缓存 并发 延迟 吞吐 分词 排序 召回 融合 压缩 存储 python numpy chroma sqlite api").split()
+
+
+def make_chunks(count: int, words_per_chunk: int = 60):
+    rng = random.Random(0)
+    ids, texts, metadatas = [], [], []
+    for i in range(count):
+        ids.append(f"chunk-{i}")
+        texts.append(" ".join(rng.choice(WORDS) for _ in range(words_per_chunk)))
+        metadatas.append({'source': f"doc_{i // 20}.md", 'type': 'document' if i % 4 else 'note'})
+    return ids, texts, metadatas
+
+
+def percentiles(samples):
+    return np.percentile(samples, 50) * 1000, np.percentile(samples, 95) * 1000
+
+
+def run(chunks: int, queries: int, k: int) -> None:
+    ids, texts, metadatas = make_chunks(chunks)
+    rng = random.Random(1)
+    query_list = [" ".join(rng.sample(WORDS, 2)) for _ in range(queries)]
+
+    db_path = os.path.join(tempfile.mkdtemp(), "keyword_index.db")
+    start = time.perf_counter()
+    index = BM25Index(db_path)
+    for i in range(0, chunks, 1000):
+        index.add(ids[i:i + 1000], texts[i:i + 1000], metadatas[i:i + 1000])
+    index.save()
+    build = time.perf_counter() - start
+
+    # 删除一个文档（20个切分）后保存，入库、删除和重新索引结束时都会保存一次
+    start = time.perf_counter()
+    index.remove(ids[:20])
+    index.save()
+    remove_save = time.perf_counter() - start
+    index.add(ids[:20], texts[:20], metadatas[:20])
+    index.save()
+    index.close()
+    start = time.perf_counter()
+    index = BM25Index(db_path)
+    load = time.perf_counter() - start
+
+    bm25_times = []
+    for query in query_list:
+        start = time.perf_counter()
+        index.search(query, k=k)
+        bm25_times.append(time.perf_counter() - start)
+
+    filtered_times = []
+    for query in query_list:
+        start = time.perf_counter()
+        index.search(query, k=k, doc_type='note')
+        filtered_times.append(time.perf_counter() - start)
+
+    scan_times = []
+    for query in query_list[:max(1, queries // 10)]:
+        start = time.perf_counter()
+        needle = query.split()[0]
+        [text for text in texts if needle in text][:k]
+        scan_times.append(time.perf_counter() - start)
+
+    print(f"{chunks}个切分, 建索引耗时 {build:.2f}s, {chunks / build:.0f} chunks/s, 索引文件 {os.path.getsize(db_path) / 2 ** 20:.1f}MB")
+    print(f"删除20个切分并保存 {remove_save * 1000:.1f}ms, 加载索引 {load:.2f}s")
+    print(f"{'方式':<16} {'p50(ms)':>9} {'p95(ms)':>9}")
+    print(f"{'BM25':<16} {percentiles(bm25_times)[0]:>9.2f} {percentiles(bm25_times)[1]:>9.2f}")
+    print(f"{'BM25 + 类型过滤':<14} {percentiles(filtered_times)[0]:>9.2f} {percentiles(filtered_times)[1]:>9.2f}")
+    print(f"{'子串扫描(不排序)':<12} {percentiles(scan_times)[0]:>9.2f} {percentiles(scan_times)[1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+    run(args.chunks, args.queries, args.k)
@@ -0,0 +1,80 @@
+"""
+Markdown 转纯文本基准：对比原来的 markdown.markdown() + BeautifulSoup.get_text()（两遍解析、构建完整的 HTML DOM）
+与单遍逐行转换（backend.markdown_text）的吞吐量。
+语料为 notes/ 目录下的笔记，循环复制到指定的文件数（默认 1 万个），每份复制的文件内容相同、文件名不同。
+分别报告只做转换（文本已在内存中）和从磁盘读取并转换（MarkdownLoader）的耗时。
+
+运行（项目根目录）：
+    python -m benchmarks.markdown_text --files 10000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import markdown
+
+from bs4 import BeautifulSoup
+from backend.loaders import load_document
+from backend.markdown_text import markdown_to_text
+
+
+def html_to_text(text: str) -> str:
+    """ 原来的转换方式，作为基准。 """
+    return BeautifulSoup(markdown.markdown(text), "html.parser").get_text()
+
+
+def make_corpus(source_directory: str, files: int) -> list:
+    notes = sorted(os.path.join(source_directory, name) for name in os.listdir(source_directory) if name.endswith('.md'))
+    directory = tempfile.mkdtemp()
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"{i:05d}_{os.path.basename(notes[i % len(notes)])}")
+        shutil.copyfile(notes[i % len(notes)], path)
+        paths.append(path)
+    return paths
+
+
+def read(path: str) -> str:
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def timed(function, items) -> tuple:
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def run(notes_directory: str, files: int) -> None:
+    paths = make_corpus(notes_directory, files)
+    texts = [read(path) for path in paths]
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1024 / 1024
+
+    old_seconds, old_results = timed(html_to_text, texts)
+    new_seconds, new_results = timed(lambda text: markdown_to_text(text)[1], texts)
+    old_load_seconds, _ = timed(lambda path: html_to_text(read(path)), paths)
+    new_load_seconds, _ = timed(load_document, paths)
+
+    old_front_matter = sum('created_at:' in text for text in old_results)
+    new_front_matter = sum('created_at:' in text for text in new_results)
+    headings = sum(text.count('\n#') + text.startswith('#') for text in new_results) / len(new_results)
+
+    print(f"{files}个笔记文件（由 notes/ 中的 {len({os.path.basename(p)[6:] for p in paths})} 个笔记复制）, 共 {megabytes:.1f} MB")
+    print(f"{'方式':<24} {'耗时(s)':>8} {'files/s':>9} {'MB/s':>7} {'加速比':>6}")
+    rows = [('HTML+BeautifulSoup 转换', old_seconds), ('单遍转换', new_seconds),
+            ('HTML+BeautifulSoup 读取+转换', old_load_seconds), ('MarkdownLoader 读取+转换', new_load_seconds)]
+    for i, (name, seconds) in enumerate(rows):
+        baseline = rows[i - i % 2][1]
+        print(f"{name:<24} {seconds:>8.2f} {files / seconds:>9.0f} {megabytes / seconds:>7.2f} {baseline / seconds:>6.2f}")
+    print(f"输出中残留 YAML 头信息的文件数: 原方式 {old_front_matter}, 单遍转换 {new_front_matter}")
+    print(f"单遍转换每个文件保留的标题行数: {headings:.1f}")
+    print(f"输出字符数: 原方式 {sum(map(len, old_results))}, 单遍转换 {sum(map(len, new_results))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--notes', default='notes')
+    parser.add_argument('--files', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.notes, args.files)
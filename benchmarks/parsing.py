@@ -0,0 +1,85 @@
+"""
+文档解析基准：对比单进程与多进程（ParserPool）解析一批 Markdown 文档的耗时。
+Markdown 转纯文本是纯 Python 的 CPU 密集操作，多线程受 GIL 限制无法加速。
+多进程的耗时包含启动解析进程的时间（每个进程需要导入解析库），另外单独报告解析进程预热后的耗时。
+两种方式的解析结果逐文档比较，确认按输入顺序返回且内容一致。
+
+运行（项目根目录）：
+    python -m benchmarks.parsing --docs 300 --workers 4
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from backend.loaders import ParserPool
+
+
+WORDS = "知识 检索 向量 摘要 文档 笔记 嵌入 模型 查询 索引 数据 系统 用户 问题 方法 markdown parser pipeline".split()
+
+
+def make_corpus(directory: str, docs: int, sections: int, seed: int = 0) -> list:
+    """ 生成包含标题、段落、列表、表格、代码块和链接的 Markdown 文档。 """
+    rng = random.Random(seed)
+    paths = []
+
+    def sentence(n: int = 30) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(n))
+
+    for i in range(docs):
+        lines = [f"# 文档 {i}", ""]
+        for j in range(sections):
+            lines += [f"## 第{j}节 {sentence(3)}", "", sentence(), f"**{sentence(4)}** 和 *{sentence(3)}*，参见 [链接](https://example.com/{i}/{j})。", ""]
+            lines += [f"- {sentence(8)}" for _ in range(4)] + [""]
+            lines += ["| 名称 | 数值 |", "| --- | --- |"] + [f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} |" for _ in range(3)] + [""]
+            lines += ["```python", f"print('{sentence(3)}')", "```", ""]
+        path = os.path.join(directory, f"doc_{i:04d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        paths.append(path)
+    return paths
+
+
+def parse_all(pool: ParserPool, paths: list) -> list:
+    results = []
+    for path, pages, error in pool.imap(paths):
+        if error is not None:
+            raise error
+        results.append((path, [page.page_content for page in pages]))
+    return results
+
+
+def run(docs: int, sections: int, workers: int) -> None:
+    paths = make_corpus(tempfile.mkdtemp(), docs, sections)
+    megabytes = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+
+    start = time.perf_counter()
+    single = parse_all(ParserPool(max_workers=1), paths)
+    single_seconds = time.perf_counter() - start
+
+    pool = ParserPool(max_workers=workers)
+    start = time.perf_counter()
+    multi = parse_all(pool, paths)
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    warm = parse_all(pool, paths)
+    warm_seconds = time.perf_counter() - start
+    pool.shutdown()
+
+    assert [path for path, _ in multi] == paths, "多进程解析结果的顺序与输入不一致"
+    assert multi == single and warm == single, "多进程解析结果与单进程不一致"
+
+    print(f"{docs}个 Markdown 文档, 共 {megabytes:.1f} MB, CPU 核数 {os.cpu_count()}")
+    print(f"{'方式':<16} {'耗时(s)':>8} {'docs/s':>8} {'MB/s':>8} {'加速比':>6}")
+    for name, seconds in [('单进程', single_seconds), (f'{workers}进程(含启动)', cold_seconds), (f'{workers}进程(预热后)', warm_seconds)]:
+        print(f"{name:<16} {seconds:>8.2f} {docs / seconds:>8.1f} {megabytes / seconds:>8.2f} {single_seconds / seconds:>6.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=300)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    run(args.docs, args.sections, args.workers)
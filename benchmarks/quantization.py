@@ -0,0 +1,128 @@
+"""
+向量量化基准：对比 FlatVectorStore 在不量化、float16、int8 三种存储方式下的常驻内存、磁盘占用、查询延迟和 recall@k。
+recall 以 numpy 直接计算的精确近邻为准；int8(无重排) 只做量化打分，不用 float32 重排，用来观察重排找回了多少召回。
+
+语料为带簇结构的随机向量（同簇向量彼此接近，近邻之间的距离差很小，量化误差更容易改变排序），由随机种子决定。
+向量库先在主进程中建好，每种存储方式再分两个独立进程运行：第一个进程打开向量库生成量化文件，
+第二个进程重新打开并查询，报告的内存为该进程查询后的常驻内存增量，不包含建库和生成量化文件时读入的页面。
+
+运行（项目根目录）：
+    python -m benchmarks.quantization --chunks 50000 --dim 1536
+"""
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from backend.vector_stores import FlatVectorStore
+from benchmarks.vector_store import rss_mb, percentiles
+
+
+# 参与比较的存储方式：(quantization, rescore_factor)
+MODES = {
+    'none': ('none', 4),
+    'float16': ('float16', 4),
+    'int8': ('int8', 4),
+    'int8(无重排)': ('int8', 1),
+}
+QUANTIZED_FILES = {'none': [], 'float16': ['vectors.f16'], 'int8': ['vectors.i8', 'scales.f32']}
+
+
+def make_data(chunks: int, dim: int, queries: int, clusters: int = 200, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, chunks)] + 0.3 * rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = vectors[rng.integers(0, chunks, queries)] + 0.05 * rng.standard_normal((queries, dim)).astype(np.float32)
+    return vectors, query_vectors
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    distances = (vectors ** 2).sum(axis=1)[None, :] - 2 * queries @ vectors.T
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return top
+
+
+def build(directory: str, vectors: np.ndarray) -> None:
+    store = FlatVectorStore(collection_name="documents", persist_directory=directory, quantization='none')
+    for i in range(0, len(vectors), 5000):
+        block = vectors[i:i + 5000]
+        store.add_embeddings([f"chunk-{j}" for j in range(i, i + len(block))], block,
+                             [f"切分 {j}" for j in range(i, i + len(block))],
+                             [{'source': f"doc_{j // 50}.md", 'type': 'document'} for j in range(i, i + len(block))])
+    store.close()
+
+
+def prepare(directory: str, quantization: str, result_queue) -> None:
+    # 打开时发现量化方式与上次不同，会从 float32 向量生成量化文件
+    start = time.perf_counter()
+    FlatVectorStore(collection_name="documents", persist_directory=directory, quantization=quantization).close()
+    result_queue.put(time.perf_counter() - start)
+
+
+def bench(directory: str, quantization: str, rescore_factor: int, queries: np.ndarray, k: int, result_queue) -> None:
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    store = FlatVectorStore(collection_name="documents", persist_directory=directory,
+                            quantization=quantization, rescore_factor=rescore_factor)
+    open_seconds = time.perf_counter() - start
+    store.search_with_embeddings(queries[0], k)  # 预热
+
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = store.search_with_embeddings(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append([int(doc.id.split('-')[1]) for doc, _, _ in found])
+    result_queue.put({'open': open_seconds, 'latency': percentiles(latencies), 'rss': rss_mb() - base_rss, 'results': results})
+
+
+def run_in_process(target, *args):
+    """ 在独立进程中运行 target，返回它放入队列的结果。 """
+    # 用 spawn 启动干净的进程，fork 出的子进程会继承主进程中语料和精确近邻的内存
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=target, args=(*args, result_queue))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    return result
+
+
+def run(chunks: int, dim: int, k: int, queries: int, seed: int) -> None:
+    vectors, query_vectors = make_data(chunks, dim, queries, seed=seed)
+    truth = exact_neighbours(vectors, query_vectors, k)
+    directory = tempfile.mkdtemp()
+    build(directory, vectors)
+    del vectors
+    collection_directory = os.path.join(directory, "flat", "documents")
+    float32_mb = os.path.getsize(os.path.join(collection_directory, "vectors.f32")) / 1024 / 1024
+
+    reports = {}
+    for mode, (quantization, rescore_factor) in MODES.items():
+        prepare_seconds = run_in_process(prepare, directory, quantization)
+        report = run_in_process(bench, directory, quantization, rescore_factor, query_vectors, k)
+        report['prepare'] = prepare_seconds
+        report['quantized_mb'] = sum(os.path.getsize(os.path.join(collection_directory, name)) / 1024 / 1024
+                                     for name in QUANTIZED_FILES[quantization])
+        report['recall'] = float(np.mean([len(set(found) & set(expected.tolist())) / k for found, expected in zip(report['results'], truth)]))
+        reports[mode] = report
+
+    print(f"{chunks}个切分, 维度 {dim}, k={k}, {queries}个查询, float32 向量文件 {float32_mb:.1f} MB")
+    print(f"{'存储方式':<12} {'recall@' + str(k):>9} {'p50(ms)':>8} {'p95(ms)':>8} {'量化(s)':>8} {'启动(s)':>8} {'内存(MB)':>9} {'量化文件(MB)':>12}")
+    for mode, report in reports.items():
+        print(f"{mode:<14} {report['recall']:>9.3f} {report['latency'][0]:>8.2f} {report['latency'][1]:>8.2f} "
+              f"{report['prepare']:>8.2f} {report['open']:>8.2f} {report['rss']:>9.1f} {report['quantized_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.chunks, args.dim, args.k, args.queries, args.seed)
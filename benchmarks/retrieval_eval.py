@@ -0,0 +1,176 @@
+"""
+检索评估：生成带标注（查询 → 来源文档）的合成语料，用本地嵌入和摘要替身入库，
+对比各检索方式的 recall@k、MRR、查询延迟 p50/p95，并报告入库吞吐量。
+语料和查询由随机种子决定，同一组参数多次运行得到的是同一份数据，便于比较不同的检索方式。
+
+查询分两类：
+    topic：询问文档的主题，答案在文档开头，摘要中通常包含
+    fact： 询问文档中部的某条事实，摘要中通常不包含，用来检验摘要筛选漏检的情况
+经过 DocumentProcessor.query 的检索方式还会报告嵌入、摘要检索、切分检索、重排各阶段的平均耗时。
+
+运行（项目根目录）：
+    python -m benchmarks.retrieval_eval --docs 100 --k 4
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+
+from typing import Callable, Dict, List
+from langchain_core.documents import Document
+
+from backend.cache import ResultCache
+from backend.VectorStor import DocumentProcessor
+from benchmarks.stubs import StubChatModel
+
+
+SYLLABLES = "安 柏 辰 德 恩 枫 歌 禾 嘉 景 凯 岚 霖 茂 宁 鹏 琪 瑞 森 泰 维 溪 雅 远 铮 舟 澜 朗 桐 芸".split()
+TOPICS = "交通规划 水资源管理 农业技术 能源政策 教育改革 医疗服务 城市绿化 文化遗产 旅游开发 数字经济".split()
+ATTRIBUTES = "成立年份 负责人 年度预算 覆盖人口 核心指标 合作单位 试点区域 验收标准".split()
+FILLER = ("相关部门在调研后认为，这项工作需要长期投入，并在实施过程中不断总结经验。"
+          "各方在会议上讨论了进度安排、资金使用和风险控制等问题，形成了初步共识。"
+          "后续将根据评估结果调整方案，确保目标按期完成，并向社会公开进展情况。").split("。")
+
+
+def make_name(rng: random.Random, length: int = 3) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(length))
+
+
+def make_corpus(directory: str, docs: int, facts_per_doc: int = 6, filler_per_fact: int = 3, seed: int = 0) -> List[Dict]:
+    """
+    生成合成语料，每个文档有一个主题和若干条事实，事实之间用无关的填充句隔开。
+
+    :return: 标注的查询列表，每项包含 query、source 和 kind（'topic' 或 'fact'）
+    """
+    rng = random.Random(seed)
+    queries = []
+    used_names = set()
+    for i in range(docs):
+        path = os.path.join(directory, f"doc_{i:04d}.md")
+        place = make_name(rng)
+        while place in used_names:
+            place = make_name(rng)
+        used_names.add(place)
+        topic = f"{place}{rng.choice(TOPICS)}"
+        lines = [f"# {topic}", "", f"本文介绍{topic}项目的背景、目标和主要事实。", ""]
+        queries.append({'query': f"{topic}项目的背景和目标是什么", 'source': path, 'kind': 'topic'})
+
+        for attribute in rng.sample(ATTRIBUTES, facts_per_doc):
+            for _ in range(filler_per_fact):
+                lines.append(rng.choice(FILLER).strip() + "。")
+            value = make_name(rng, 4) if attribute != '成立年份' else str(rng.randint(1950, 2024))
+            entity = f"{place}{make_name(rng, 2)}中心"
+            lines.append(f"{entity}的{attribute}是{value}。")
+            lines.append("")
+            queries.append({'query': f"{entity}的{attribute}是什么", 'source': path, 'kind': 'fact'})
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    return queries
+
+
+def new_processor(persist_directory: str, vector_store_backend: str, llm_latency: float) -> DocumentProcessor:
+    # 不使用摘要缓存，也不在项目目录下创建缓存文件
+    os.environ["summary_cache_path"] = ""
+    processor = DocumentProcessor(persist_directory=persist_directory, embedding_backend='local',
+                                  llm=StubChatModel(latency=llm_latency), vector_store_backend=vector_store_backend)
+    # 关闭检索结果缓存，每次查询都走完整的检索路径
+    processor.result_cache = ResultCache(max_size=0)
+    return processor
+
+
+# 参与比较的检索方式：(processor, 查询, k) -> 按相关度排序的切分
+MODES: Dict[str, Callable[[DocumentProcessor, str, int], List[Document]]] = {
+    'summary': lambda processor, query, k: processor.query(query, 'all', k=k, summary_k=1),
+    'summary@3': lambda processor, query, k: processor.query(query, 'all', k=k, summary_k=3),
+    'summary@3+mmr': lambda processor, query, k: processor.query(query, 'all', k=k, summary_k=3, mmr=True),
+    'direct': lambda processor, query, k: processor.query(query, 'all', k=k, strategy='direct'),
+    'both': lambda processor, query, k: processor.query(query, 'all', k=k, summary_k=3, strategy='both'),
+    'hybrid': lambda processor, query, k: processor.hybrid_search(query, 'all', k=k),
+}
+STAGES = ('embed', 'summary', 'search', 'rerank')
+
+
+def evaluate(processor: DocumentProcessor, queries: List[Dict], modes: List[str], k: int) -> Dict[str, Dict]:
+    """
+    对每种检索方式计算 recall@k、MRR 和查询延迟。
+
+    :return: {检索方式: {'recall': ..., 'mrr': ..., 'p50_ms': ..., 'p95_ms': ..., 'recall_by_kind': {...}, 'stage_ms': {...}}}
+             stage_ms 为 query 各阶段的平均耗时，不经过 query 的检索方式为空
+    """
+    report = {}
+    for mode in modes:
+        search = MODES[mode]
+        search(processor, queries[0]['query'], k)  # 预热
+        latencies, reciprocal_ranks, hits, stages = [], [], {}, {}
+        for item in queries:
+            processor.last_query_timings = {}
+            start = time.perf_counter()
+            results = search(processor, item['query'], k)
+            latencies.append(time.perf_counter() - start)
+            for stage in STAGES:
+                if stage in processor.last_query_timings:
+                    stages.setdefault(stage, []).append(processor.last_query_timings[stage])
+            sources = [doc.metadata.get('source') for doc in results[:k]]
+            rank = sources.index(item['source']) + 1 if item['source'] in sources else None
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            hits.setdefault(item['kind'], []).append(rank is not None)
+        all_hits = [hit for kind_hits in hits.values() for hit in kind_hits]
+        report[mode] = {
+            'recall': float(np.mean(all_hits)),
+            'mrr': float(np.mean(reciprocal_ranks)),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p95_ms': float(np.percentile(latencies, 95) * 1000),
+            'recall_by_kind': {kind: float(np.mean(kind_hits)) for kind, kind_hits in hits.items()},
+            'stage_ms': {stage: float(np.mean(samples) * 1000) for stage, samples in stages.items()},
+        }
+    return report
+
+
+def print_report(ingestion: Dict, report: Dict[str, Dict], k: int) -> None:
+    print(f"入库: {ingestion['documents']}个文档, {ingestion['chunks']}个切分, 耗时 {ingestion['seconds']:.2f}s, "
+          f"{ingestion['docs_per_second']:.1f} docs/s, {ingestion['chunks_per_second']:.1f} chunks/s")
+    kinds = sorted({kind for metrics in report.values() for kind in metrics['recall_by_kind']})
+    header = f"{'检索方式':<14} {'recall@' + str(k):>9} {'MRR':>6} " + " ".join(f"{kind + '召回':>8}" for kind in kinds) + f" {'p50(ms)':>8} {'p95(ms)':>8}"
+    print(header)
+    for mode, metrics in report.items():
+        by_kind = " ".join(f"{metrics['recall_by_kind'].get(kind, 0.0):>10.3f}" for kind in kinds)
+        print(f"{mode:<16} {metrics['recall']:>9.3f} {metrics['mrr']:>6.3f} {by_kind} {metrics['p50_ms']:>8.2f} {metrics['p95_ms']:>8.2f}")
+
+    print()
+    print("各阶段平均耗时(ms):")
+    print(f"{'检索方式':<14} " + " ".join(f"{stage:>8}" for stage in STAGES))
+    for mode, metrics in report.items():
+        if metrics['stage_ms']:
+            print(f"{mode:<16} " + " ".join(f"{metrics['stage_ms'].get(stage, 0.0):>8.2f}" for stage in STAGES))
+
+
+def run(docs: int, k: int, modes: List[str], vector_store_backend: str, llm_latency: float, seed: int, output: str = None) -> Dict:
+    corpus = tempfile.mkdtemp()
+    queries = make_corpus(corpus, docs, seed=seed)
+    processor = new_processor(tempfile.mkdtemp(), vector_store_backend, llm_latency)
+    ingestion = processor.ingest_directory(corpus, doc_type='document')
+    report = evaluate(processor, queries, modes, k)
+    print()
+    print_report(ingestion, report, k)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({'docs': docs, 'k': k, 'seed': seed, 'vector_store_backend': vector_store_backend,
+                       'ingestion': ingestion, 'retrieval': report}, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--vector-store', default='flat', choices=['chroma', 'flat'])
+    parser.add_argument('--llm-latency', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="把结果保存为 JSON，便于与其他运行比较")
+    args = parser.parse_args()
+    run(args.docs, args.k, args.modes, args.vector_store, args.llm_latency, args.seed, args.output)
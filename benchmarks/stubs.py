@@ -0,0 +1,23 @@
+"""
+基准测试用的本地替身：不联网的摘要模型。
+"""
+import time
+
+from langchain_core.messages import AIMessage
+
+
+class StubChatModel:
+    """ 模拟摘要模型：等待固定延迟后返回输入正文的前若干字作为“摘要”。 """
+    model_name = "stub-summary"
+
+    def __init__(self, latency: float = 0.0, summary_chars: int = 150):
+        self.latency = latency
+        self.summary_chars = summary_chars
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> AIMessage:
+        self.calls += 1
+        time.sleep(self.latency)
+        # 提示词与正文以第一个换行分隔
+        body = prompt.split("\n", 1)[-1]
+        return AIMessage(content=body[:self.summary_chars])
@@ -0,0 +1,105 @@
+"""
+向量库后端基准：对比 Chroma 与内存映射精确检索（FlatVectorStore）的建库耗时、启动耗时、查询延迟、内存和磁盘占用。
+每个后端在独立进程中运行，内存增量互不影响。
+
+运行（项目根目录）：
+    python -m benchmarks.vector_store --chunks 20000 --dim 1536
+"""
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from backend.vector_stores import ChromaStore, FlatVectorStore
+
+
+BACKENDS = {'chroma': ChromaStore, 'flat': FlatVectorStore}
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1024 / 1024
+
+
+def make_data(chunks: int, dim: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk-{i}" for i in range(chunks)]
+    texts = [f"切分 {i}" for i in range(chunks)]
+    metadatas = [{'source': f"doc_{i // 50}.md", 'type': 'document'} for i in range(chunks)]
+    queries = vectors[rng.integers(0, chunks, 200)] + 0.1 * rng.standard_normal((200, dim)).astype(np.float32)
+    return ids, texts, metadatas, vectors, queries
+
+
+def percentiles(samples):
+    return np.percentile(samples, 50) * 1000, np.percentile(samples, 95) * 1000
+
+
+def bench(backend: str, chunks: int, dim: int, k: int, result_queue) -> None:
+    ids, texts, metadatas, vectors, queries = make_data(chunks, dim)
+    directory = tempfile.mkdtemp()
+    base_rss = rss_mb()
+
+    start = time.perf_counter()
+    store = BACKENDS[backend](collection_name="documents", persist_directory=directory)
+    for i in range(0, chunks, 1000):
+        store.add_embeddings(ids[i:i + 1000], vectors[i:i + 1000].tolist(), texts[i:i + 1000], metadatas[i:i + 1000])
+    build = time.perf_counter() - start
+    del store
+
+    start = time.perf_counter()
+    store = BACKENDS[backend](collection_name="documents", persist_directory=directory)
+    store.search_with_embeddings(queries[0].tolist(), k)
+    open_seconds = time.perf_counter() - start
+
+    plain, filtered, results = [], [], []
+    sources = [f"doc_{i}.md" for i in range(0, chunks // 50, max(chunks // 50 // 5, 1))][:5]
+    for query in queries:
+        query = query.tolist()
+        start = time.perf_counter()
+        results.append([doc.id for doc, _, _ in store.search_with_embeddings(query, k)])
+        plain.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        store.search_with_embeddings(query, k, filter={'source': {'$in': sources}})
+        filtered.append(time.perf_counter() - start)
+
+    result_queue.put({
+        'backend': backend, 'build': build, 'open': open_seconds,
+        'plain': percentiles(plain), 'filtered': percentiles(filtered),
+        'rss': rss_mb() - base_rss, 'disk': directory_mb(directory), 'results': results,
+    })
+
+
+def run(chunks: int, dim: int, k: int) -> None:
+    reports = {}
+    for backend in BACKENDS:
+        result_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=bench, args=(backend, chunks, dim, k, result_queue))
+        process.start()
+        reports[backend] = result_queue.get()
+        process.join()
+
+    # 以精确检索的结果为准计算 Chroma（HNSW 近似检索）的召回率
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(reports['chroma']['results'], reports['flat']['results'])])
+    print(f"{chunks}个切分, 维度 {dim}, k={k}")
+    print(f"{'后端':<8} {'建库(s)':>8} {'启动(s)':>8} {'p50(ms)':>8} {'p95(ms)':>8} {'过滤p50':>8} {'过滤p95':>8} {'内存(MB)':>9} {'磁盘(MB)':>9}")
+    for backend, report in reports.items():
+        print(f"{backend:<8} {report['build']:>8.2f} {report['open']:>8.2f} {report['plain'][0]:>8.2f} {report['plain'][1]:>8.2f} "
+              f"{report['filtered'][0]:>8.2f} {report['filtered'][1]:>8.2f} {report['rss']:>9.1f} {report['disk']:>9.1f}")
+    print(f"Chroma 相对精确检索的 recall@{k}: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+    run(args.chunks, args.dim, args.k)
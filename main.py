@@ -20,7 +20,7 @@ QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps)
 # 使用标准的导入语法
 from backend.AI import ATRI
 from backend.note import NoteManager
-from backend.VectorStor import DocumentProcessor
+from backend.resources import get_document_processor, reset_shared
 from backend.Todo import TodoDatabase
 from frontend.ui_design.Ui_untitled import Ui_Form
  #主窗口
@@ -82,7 +82,8 @@ class MyMainWindow(QWidget,Ui_Form):
 
         # 知识库搜索（类型3或全部）
         if search_type in [0, 3]:
-            knowledge_results = self.knowledge.keyword_search(query_text, doc_type='document')
+            # 只返回包含全部查询词项的前20个切分，否则中文查询会命中所有共享一个字的切分
+            knowledge_results = self.knowledge.keyword_search(query_text, doc_type='document', k=20, min_coverage=1.0)
             for idx, doc in enumerate(knowledge_results):
                 content_preview = doc[:200] + "..." if len(doc) > 200 else doc
                 full_content = doc  # 完整内容
@@ -314,7 +315,7 @@ class MyMainWindow(QWidget,Ui_Form):
 
     """知识库"""
     def setKnowledge(self):
-        self.knowledge = DocumentProcessor()
+        self.knowledge = get_document_processor()
         self.doc_type = 'all'
         document_list = self.knowledge.get_document_list(doc_type = 'all')
         self.listWidget.addItems(document_list)
@@ -642,6 +643,13 @@ class MyMainWindow(QWidget,Ui_Form):
         selected_model = self.model_combo.currentText()
         set_key(self.env_path, "CURRENT_MODEL", selected_model)
 
+        # 共享的知识库和模型客户端按新的密钥和模型重新创建，持有旧实例的对象一并更新
+        os.environ["API_KEY"] = self.api_key.text()
+        reset_shared()
+        self.knowledge = get_document_processor()
+        self.note.doc_processor = self.knowledge
+        self.atri = ATRI(model=selected_model)
+
         print("设置已保存！")
         
         